@@ -1,17 +1,66 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
+import logging
+import os
+import sqlite3
 import sys
+import time
+import weakref
 from datetime import datetime
 from functions import (
     format_currency,
-    format_percentage,
-    format_date,
+    format_currency_values,
     format_multiple,
-    format_large_number,
+    format_percentage,
+    format_percentage_values,
+    format_date_values,
+    format_multiple_values,
+    format_large_number_values,
+    format_table,
+    style_format,
     add_new_row,
     update_calculated_columns,
+    recalculate_changed_companies,
+    timed_stage,
+)
+from calculations import (
+    CHANGE_LOG_COLUMNS,
     calculate_increase_value,
+    company_fingerprints,
+    company_rows,
+    merge_window,
+    portfolio_totals,
+    recalculate_companies,
+    record_recalculation,
+    round_problems,
+    update_total_position,
+    window_rows,
 )
+from analytics import portfolio_returns
+from export import EXPORT_DIR, EXPORT_FORMATS, export_tables
+from cache import load_round_csv_cached, load_round_csvs_cached, process_data_cached, read_cached, source_key, sources_key
+from loading import compact_round_table, expand_round_table, memory_bytes, round_csv_paths
+from scenarios import PERCENTILES, current_positions, percentile_bands, random_draws, simulate
+from snapshot import SNAPSHOT_DIR, latest_snapshot, read_snapshot, write_snapshot
+from store import (
+    changed_rounds,
+    mark_snapshot,
+    read_company,
+    read_portfolio,
+    read_totals,
+    replace_portfolio,
+    round_signatures,
+    save_changes,
+    stored_snapshot,
+    store_path,
+    stored_source,
+    update_source,
+    write_totals,
+)
+from timing import profiled, timings_frame
+from validation import validate
+from watch import apply_round_changes, source_stats
 
 # This program should allow you to import data in a specified format (see Round.csv) which is then validated
 # for data in the right format, then totals are calculated
@@ -19,9 +68,16 @@ from functions import (
 # Set the page configuration to "wide" layout
 st.set_page_config(layout="wide")
 
-debug_harness = False
+log = logging.getLogger("roundcalc")
 auto_load = True
 
+# Portfolios with more rows than this are edited a page of companies at a time by default
+EDIT_WINDOW_ROWS = 2000
+
+# Loaded files are checked for changes this often, and their changes taken in once they've stayed the same this long
+WATCH_SECONDS = 5
+WATCH_SETTLE_SECONDS = 1
+
 # --- Column Configuration ---
 column_config = {
     "Round #": st.column_config.NumberColumn("#", help="Round Number", format="%d"),
@@ -39,15 +95,38 @@ column_config = {
     "Date": st.column_config.DateColumn("Date", help="Date"),
 }
 
+# Batch formatters for each column, used with style_format and format_table
 summary_format_style = {
-    "Total_Invested": format_currency,
-    "Total_Value": format_currency,
-    "First_Val": format_large_number,
-    "Last_Val": format_large_number,
-    "First_Date": format_date,
-    "Last_Date": format_date,
-    "Round Increase": format_multiple,
-    "Dilution Increase": format_multiple,
+    "Total_Invested": format_currency_values,
+    "Total_Value": format_currency_values,
+    "First_Val": format_large_number_values,
+    "Last_Val": format_large_number_values,
+    "First_Date": format_date_values,
+    "Last_Date": format_date_values,
+    "Round Increase": format_multiple_values,
+    "Dilution Increase": format_multiple_values,
+}
+
+returns_format_style = {
+    "Invested": format_currency_values,
+    "Value": format_currency_values,
+    "First Investment": format_date_values,
+    "TVPI": format_multiple_values,
+    "MOIC": format_multiple_values,
+    "XIRR": format_percentage_values,
+}
+
+round_format_style = {
+    "Total Invested": format_large_number_values,
+    "Premoney": format_large_number_values,
+    "Post Money": format_large_number_values,
+    "Round Ownership": format_percentage_values,
+    "My Ownership": format_percentage_values,
+    "Increase (round/round)": format_multiple_values,
+    "Dilution (est)": format_multiple_values,
+    "Invested": format_currency_values,
+    "Increase (Value)": format_currency_values,
+    "Date": format_date_values,
 }
 
 # --- Styling Functions for DataFrames ---
@@ -56,27 +135,19 @@ def highlight_estimated(val):
     return "background-color: yellow" if val == "Y" else ""
 
 
-def highlight_values_by_estimated(row):
-    """Highlights 'Total Invested' and 'Post Money' with light yellow background if 'Estimated' is 'Y' in the same row."""
-    styles = []
-    for col in row.index:
-        if row["Estimated"] == "Y" and col in ["Total Invested", "Post Money"]:
-            styles.append("background-color: lightyellow; color: black")
-        else:
-            styles.append("")
+def highlight_values_by_estimated(df):
+    """Highlights 'Total Invested' and 'Post Money' with light yellow background in the rows where 'Estimated' is 'Y',
+    for Styler.apply(axis=None)."""
+    styles = pd.DataFrame("", index=df.index, columns=df.columns)
+    styles.loc[(df["Estimated"] == "Y").to_numpy(), ["Total Invested", "Post Money"]] = "background-color: lightyellow; color: black"
     return styles
 
 
 def style_filtered_data(filtered_edited_df):
     """Styles the filtered DataFrame for display, applying various formatting and highlighting."""
     styled_df = filtered_edited_df.style.map(highlight_estimated, subset=["Estimated"])
-    styled_df = styled_df.apply(highlight_values_by_estimated, axis=1)
-    # styled_df = styled_df.format(summary_format_style)
-    styled_df = styled_df.format(format_large_number, subset=["Total Invested", "Premoney", "Post Money"])
-    styled_df = styled_df.format(format_percentage, subset=["Round Ownership", "My Ownership"])
-    styled_df = styled_df.format(format_multiple, subset=["Increase (round/round)", "Dilution (est)"])
-    styled_df = styled_df.format(format_currency, subset=["Invested", "Increase (Value)"])
-    styled_df = styled_df.format(format_date, subset=["Date"])
+    styled_df = styled_df.apply(highlight_values_by_estimated, axis=None)
+    styled_df = style_format(styled_df, round_format_style)
     return styled_df
 
 
@@ -87,81 +158,493 @@ if "edited_df" not in st.session_state:
     st.session_state.edited_df = pd.DataFrame()
 if "summary_df" not in st.session_state:
     st.session_state.summary_df = pd.DataFrame()
+if "totals_cache" not in st.session_state:
+    st.session_state.totals_cache = {}
+if "returns_df" not in st.session_state:
+    st.session_state.returns_df = None
+if "change_set" not in st.session_state:
+    st.session_state.change_set = pd.DataFrame(columns=CHANGE_LOG_COLUMNS)
 if "menu_choice" not in st.session_state:
     st.session_state.menu_choice = "About"
+if "recalc_cache" not in st.session_state:
+    st.session_state.recalc_cache = {}
+if "incremental_recalc" not in st.session_state:
+    st.session_state.incremental_recalc = True
+if "source_key" not in st.session_state:
+    st.session_state.source_key = None
+if "bad_rows" not in st.session_state:
+    st.session_state.bad_rows = pd.DataFrame()
+if "track_memory" not in st.session_state:
+    st.session_state.track_memory = False
+if "profile_report" not in st.session_state:
+    st.session_state.profile_report = None
+if "float32_ratios" not in st.session_state:
+    st.session_state.float32_ratios = False
+if "memory_saved" not in st.session_state:
+    st.session_state.memory_saved = None
+if "browse_cache" not in st.session_state:
+    st.session_state.browse_cache = {"views": {}}
+if "store_signatures" not in st.session_state:
+    st.session_state.store_signatures = None
+if "store_path" not in st.session_state:
+    st.session_state.store_path = None
+if "loaded_from_store" not in st.session_state:
+    st.session_state.loaded_from_store = False
+if "overlapping_rows" not in st.session_state:
+    st.session_state.overlapping_rows = pd.DataFrame()
+if "snapshot" not in st.session_state:
+    st.session_state.snapshot = None
+if "watched" not in st.session_state:
+    st.session_state.watched = None
+if "source_signatures" not in st.session_state:
+    st.session_state.source_signatures = None
+if "watch_message" not in st.session_state:
+    st.session_state.watch_message = None
+# Stage timings of this rerun, shown in the sidebar
+st.session_state.timings = []
 
 
 # --- Functions ---
-def load_data(uploaded_file):
-    """Loads data from a CSV file, handling data type conversions and potential errors."""
+def compact(df):
+    """Returns the round table in the compact form kept in the session (see loading.compact_round_table)."""
+    return compact_round_table(df, st.session_state.float32_ratios)
+
+
+def load_data(uploaded_file, discard_edits=False, precedence="last"):
+    """Loads data from a CSV file into the session, handling data type conversions and potential errors.
+    Nothing is reloaded while the file is unchanged, so edits are kept, and files loaded before come from the cache.
+    Edits saved in the store for this file are loaded with it, unless discard_edits. uploaded_file can also be a list
+    of files or a folder, whose files are merged keeping overlapping rounds by precedence (see loading.merge_round_tables).
+    Files given by path are watched, and while they are their changes are taken in by watch_sources rather than here."""
+    watched = st.session_state.watched
+    if (watched is not None and watched["sources"] == uploaded_file and watched["precedence"] == precedence
+            and st.session_state.get("watch_files", True) and not discard_edits):
+        # Changes to watched files are taken in by watch_sources
+        return
     try:
-        df = pd.read_csv(uploaded_file, skiprows=1)
-        cols_to_convert = [
-            "Total Invested",
-            "Premoney",
-            "Post Money",
-            "Invested",
-            "Increase (Value)",
-            "Round Ownership",
-            "My Ownership",
-            "Increase (round/round)",
-            "Dilution (est)",
-        ]
-        for col in cols_to_convert:
-            df[col] = df[col].fillna(0)  # Set values to 0 if they are not a number
-            df[col] = (
-                df[col].replace(r"[^\d.]", "", regex=True).astype(float)
-            )  # Force all values to a float
-
-        # divide percentage column values by 100
-        percentage_columns = ["Round Ownership", "My Ownership"]
-        for col in percentage_columns:
-            df[col] = df[col]/100
-        
-        # convert dates
-        df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
-        return df
+        sources = resolve_sources(uploaded_file)
+        merging = isinstance(sources, list)
+        key = sources_key(sources, precedence) if merging else source_key(sources)
+        # Files given by path are watched for changes (see watch_sources)
+        watching = isinstance(uploaded_file, (str, os.PathLike))
+        st.session_state.watched = {"sources": uploaded_file, "precedence": precedence, "stats": source_stats(uploaded_file)} if watching else None
+        if key == st.session_state.source_key and not discard_edits:
+            return
+        st.session_state.source_signatures = None
+        st.session_state.watch_message = None
+        st.session_state.store_path = store_path(portfolio_name(uploaded_file, key, precedence))
+        stored_key, edited = stored_source(st.session_state.store_path)
+        if stored_key == key and not discard_edits:
+            if load_snapshot_data(key, stored_snapshot(st.session_state.store_path), edited):
+                return
+            if edited:
+                load_stored_data(key)
+                return
+        with timed_stage("load") as stage:
+            key, df, bad_rows, overlapping_rows = read_sources(sources, precedence)
+            stage["Rows"] = len(df)
+        with timed_stage("recalculation (load)", len(df)):
+            processed = process_data_cached(key, df)
     except Exception:
         exc_type, exc_value, exc_traceback = sys.exc_info()
         st.write(
             f"Exception type {exc_type} with value {exc_value} and traceback {exc_traceback}"
         )
-        return pd.DataFrame()
-
-
-def process_data(df, show_changes):
-    """Processes the data by updating calculated columns and increase values."""
-    df = update_calculated_columns(df, show_changes)
-    df = calculate_increase_value(df)
-    return df
-
-
-def calculate_and_display_total_position(df):
-    """Calculates and displays the total position for each company."""
-    summary_df = df.groupby("Name").agg(
-        Rounds=("Round #", "count"),
-        Total_Invested=("Invested", "sum"),
-        Total_Value=("Increase (Value)", "sum"),
-        First_Val=("Post Money", "first"),
-        Last_Val=("Post Money", "last"),
-        First_Date=("Date", "first"),
-        Last_Date=("Date", "last"),
-    ).reset_index()
-    summary_df["Round Increase"] = summary_df["Last_Val"] / summary_df["First_Val"]
-    summary_df["Dilution Increase"] = summary_df["Total_Value"] / summary_df["Total_Invested"]
-    summary_df.sort_values(by="Dilution Increase", ascending=False, inplace=True)
-    summary_df_styled = summary_df.style.format(summary_format_style)
-    return summary_df, summary_df_styled
+        st.session_state.edited_df = pd.DataFrame()
+        st.session_state.source_key = None
+        return
+    loaded_bytes = memory_bytes(df)
+    df = compact(df)
+    processed = compact(processed)
+    st.session_state.memory_saved = (loaded_bytes, loaded_bytes - memory_bytes(df))
+    st.session_state.edited_df = df
+    st.session_state.bad_rows = bad_rows
+    st.session_state.overlapping_rows = overlapping_rows
+    st.session_state.source_key = key
+    st.session_state.loaded_from_store = False
+    st.session_state.totals_cache = {}
+    st.session_state.returns_df = None
+    st.session_state.change_set = pd.DataFrame(columns=CHANGE_LOG_COLUMNS)
+    # The recalculation of the file as loaded is already known
+    st.session_state.recalc_cache = {}
+    record_recalculation(st.session_state.recalc_cache, df, processed)
+    try:
+        with timed_stage("store", len(df)):
+            if stored_key == key and not edited:
+                st.session_state.store_signatures = round_signatures(df)
+            else:
+                st.session_state.store_signatures = replace_portfolio(st.session_state.store_path, df, key)
+    except (sqlite3.Error, OSError) as exc:
+        st.session_state.store_signatures = None
+        st.warning(f"Edits won't be saved, the store at {st.session_state.store_path} could not be written: {exc}")
+    # The rounds as loaded, to find the ones that change in the file later
+    st.session_state.source_signatures = st.session_state.store_signatures
+    if st.session_state.source_signatures is None:
+        st.session_state.source_signatures = round_signatures(df)
+    publish_snapshot({"rounds": df, "processed": processed, "bad_rows": bad_rows, "overlapping_rows": overlapping_rows})
+
+
+def portfolio_name(uploaded_file, key, precedence):
+    """Names the portfolio loaded from uploaded_file (see load_data) with cache key key, for its store: files and
+    folders given by path by their path, so the edits follow the file as it changes, and uploaded files by their key."""
+    if isinstance(uploaded_file, (str, os.PathLike)):
+        return f"{os.path.abspath(uploaded_file)} ({precedence})"
+    return key
+
+
+def resolve_sources(uploaded_file):
+    """Returns the file, or the list of files to merge, that uploaded_file (see load_data) stands for."""
+    sources = round_csv_paths(uploaded_file) if isinstance(uploaded_file, (str, os.PathLike)) else uploaded_file
+    if isinstance(sources, list) and len(sources) == 1:
+        sources = sources[0]
+    return sources
+
+
+def read_sources(sources, precedence):
+    """Loads sources (see resolve_sources) through the cache. Returns the cache key, the round table, the values that
+    could not be read and the rounds dropped as overlapping."""
+    # pyarrow is installed with streamlit and is the fastest reader
+    if isinstance(sources, list):
+        return load_round_csvs_cached(sources, "pyarrow", precedence)
+    key, df, bad_rows = load_round_csv_cached(sources, engine="pyarrow")
+    return key, df, bad_rows, pd.DataFrame()
+
+
+def load_changed_rounds():
+    """Takes in the rounds of the watched files that were inserted, changed or deleted since they were loaded, keeping
+    the edits made since to the other rounds and recalculating only the companies whose rounds changed. The files are
+    loaded again as a whole if the rounds they were loaded with aren't known."""
+    watched = st.session_state.watched
+    watched["stats"] = source_stats(watched["sources"])
+    previous = st.session_state.source_signatures
+    if previous is None:
+        loaded = read_cached(st.session_state.source_key, "loaded")
+        if loaded is None:
+            st.session_state.watched = None
+            load_data(watched["sources"], precedence=watched["precedence"])
+            return
+        previous = round_signatures(compact(loaded))
+    try:
+        with timed_stage("load changes") as stage:
+            key, df, bad_rows, overlapping_rows = read_sources(resolve_sources(watched["sources"]), watched["precedence"])
+            stage["Rows"] = len(df)
+    except Exception as exc:
+        log.warning("Changes to %s not loaded: %s", watched["sources"], exc)
+        return
+    if key == st.session_state.source_key:
+        return
+    df = compact(df)
+    with timed_stage("apply changes", len(df)) as stage:
+        changed, removed, signatures = changed_rounds(previous, df)
+        patched, names = apply_round_changes(st.session_state.edited_df, changed, removed)
+        stage["Rows"] = len(changed) + len(removed)
+    with timed_stage("recalculation (changed rounds)", len(names)):
+        patched = compact(recalculate_companies(patched, names))
+    st.session_state.source_key = key
+    st.session_state.source_signatures = signatures
+    st.session_state.bad_rows = bad_rows
+    st.session_state.overlapping_rows = overlapping_rows
+    save_edits(patched)
+    if st.session_state.store_signatures is not None:
+        try:
+            update_source(st.session_state.store_path, key)
+        except (sqlite3.Error, OSError) as exc:
+            log.warning("Source of the store not updated: %s", exc)
+    if st.session_state.totals_cache and names:
+        update_totals(patched, names)
+    st.session_state.watch_message = (
+        f"Changes taken in at {datetime.now():%H:%M:%S}: {len(changed)} rounds added or changed, {len(removed)} deleted, "
+        f"{len(names)} companies recalculated."
+    )
 
 
+@st.fragment(run_every=WATCH_SECONDS)
+def watch_sources():
+    """Checks the size and modification time of the watched files every WATCH_SECONDS and takes in their changes once
+    they've stayed the same for WATCH_SETTLE_SECONDS, so a file isn't read while it's being rewritten."""
+    watched = st.session_state.watched
+    stats = source_stats(watched["sources"])
+    if stats == watched["stats"]:
+        watched.pop("pending", None)
+    elif "pending" not in watched or watched["pending"][0] != stats:
+        watched["pending"] = (stats, time.monotonic())
+    elif time.monotonic() - watched["pending"][1] >= WATCH_SETTLE_SECONDS:
+        del watched["pending"]
+        load_changed_rounds()
+        st.rerun()
+    if st.session_state.watch_message:
+        st.caption(st.session_state.watch_message)
+
+
+def load_stored_data(key):
+    """Loads the round table and totals saved in the store, with the edits made to the file with cache key key."""
+    with timed_stage("load (store)") as stage:
+        df = read_portfolio(st.session_state.store_path)
+        stage["Rows"] = len(df)
+        summary_df = read_totals(st.session_state.store_path)
+    st.session_state.memory_saved = None
+    st.session_state.edited_df = compact(df)
+    st.session_state.summary_df = summary_df
+    st.session_state.bad_rows = pd.DataFrame()
+    st.session_state.overlapping_rows = pd.DataFrame()
+    st.session_state.source_key = key
+    st.session_state.loaded_from_store = True
+    st.session_state.recalc_cache = {}
+    st.session_state.totals_cache = {}
+    st.session_state.returns_df = None
+    st.session_state.change_set = pd.DataFrame(columns=CHANGE_LOG_COLUMNS)
+    st.session_state.store_signatures = round_signatures(st.session_state.edited_df)
+    publish_snapshot({"rounds": st.session_state.edited_df, "summary": summary_df})
+
+
+def load_snapshot_data(key, version, edited):
+    """Loads the round table, its recalculation and totals from version version of the shared snapshot of the file
+    with cache key key, mapped rather than read, as the store holds the same. Returns False if there is no such version."""
+    if version is None:
+        return False
+    with timed_stage("load (snapshot)") as stage:
+        snapshot = read_snapshot(key, version)
+        if snapshot is None:
+            return False
+        stage["Rows"] = len(snapshot["rounds"])
+        use_snapshot(snapshot)
+    st.session_state.memory_saved = None
+    st.session_state.bad_rows = snapshot.get("bad_rows", pd.DataFrame())
+    st.session_state.overlapping_rows = snapshot.get("overlapping_rows", pd.DataFrame())
+    st.session_state.source_key = key
+    st.session_state.loaded_from_store = edited
+    return True
+
+
+def use_snapshot(snapshot):
+    """Makes the frames of a mapped snapshot (see snapshot.read_snapshot) the round table, recalculation and totals
+    of the session, and the rounds stored."""
+    st.session_state.snapshot = snapshot
+    st.session_state.edited_df = snapshot["rounds"]
+    st.session_state.recalc_cache = {}
+    if "processed" in snapshot:
+        record_recalculation(st.session_state.recalc_cache, snapshot["rounds"], snapshot["processed"])
+    st.session_state.totals_cache = {}
+    st.session_state.returns_df = None
+    st.session_state.change_set = pd.DataFrame(columns=CHANGE_LOG_COLUMNS)
+    st.session_state.summary_df = snapshot.get("summary", pd.DataFrame())
+    st.session_state.store_signatures = round_signatures(snapshot["rounds"])
+
+
+def publish_snapshot(tables):
+    """Writes the frames of tables (see snapshot.write_snapshot) as a new version of the shared snapshot of the loaded
+    file, marks the store as holding it and switches the session to the mapped frames, so their memory is shared with
+    the other sessions that map them."""
+    key = st.session_state.source_key
+    try:
+        with timed_stage("write snapshot", len(tables["rounds"])):
+            version = write_snapshot(key, tables)
+            if st.session_state.store_signatures is not None:
+                mark_snapshot(st.session_state.store_path, version)
+        with timed_stage("map snapshot", len(tables["rounds"])):
+            snapshot = read_snapshot(key, version)
+    except (OSError, ValueError, TypeError, sqlite3.Error) as exc:
+        log.warning("Snapshot of %s not written: %s", key, exc)
+        return
+    if snapshot is None:
+        return
+    # The mapped frames hold the same values, so what was worked out from the session's frames still holds
+    st.session_state.snapshot = snapshot
+    st.session_state.edited_df = snapshot["rounds"]
+    if "processed" in snapshot and st.session_state.recalc_cache.get("result") is not None:
+        st.session_state.recalc_cache["result"] = snapshot["processed"]
+    if "summary" in snapshot:
+        st.session_state.summary_df = snapshot["summary"]
+
+
+def pick_up_snapshot():
+    """Switches the session to a newer version of the snapshot of its file, written by another session after a
+    recalculation, unless this session has edited its round table since it was mapped or the store has changed since."""
+    snapshot = st.session_state.snapshot
+    if snapshot is None or st.session_state.edited_df is not snapshot["rounds"]:
+        return
+    latest = latest_snapshot(st.session_state.source_key)
+    if latest is None or latest <= snapshot["version"]:
+        return
+    try:
+        if stored_snapshot(st.session_state.store_path) != latest:
+            return
+    except (sqlite3.Error, OSError):
+        return
+    with timed_stage("load (newer snapshot)"):
+        newer = read_snapshot(st.session_state.source_key, latest)
+        if newer is not None:
+            use_snapshot(newer)
+
+
+def save_edits(df):
+    """Makes df the edited round table and writes the rounds that changed to the store."""
+    st.session_state.edited_df = df
+    if st.session_state.store_signatures is None:
+        return
+    try:
+        with timed_stage("save changes", len(df)):
+            st.session_state.store_signatures, _ = save_changes(st.session_state.store_path, st.session_state.store_signatures, df)
+    except (sqlite3.Error, OSError) as exc:
+        st.session_state.store_signatures = None
+        st.warning(f"Edits won't be saved, the store at {st.session_state.store_path} could not be written: {exc}")
+
+
+def process_data(df, show_changes="No Changes"):
+    """Processes the data by updating calculated columns and increase values, returning it in the compact form."""
+    if st.session_state.incremental_recalc:
+        # Only the companies edited since the last recalculation are recalculated
+        with timed_stage("recalculation (changed companies)", len(df)):
+            result = compact(recalculate_changed_companies(df, st.session_state.recalc_cache, show_changes))
+        if st.session_state.float32_ratios:
+            # Remember the rounded ratios as the result, or every company would look edited next time
+            cache = st.session_state.recalc_cache
+            record_recalculation(cache, df, result, cache["input_fingerprints"])
+        return result
+    with timed_stage("recalculation", len(df)):
+        df = update_calculated_columns(df, show_changes)
+    with timed_stage("increase value", len(df)):
+        df = calculate_increase_value(df)
+    return compact(df)
+
+
+def update_totals(df, names=None, fingerprints=None):
+    """Updates the total position of the companies of df that changed (see calculations.update_total_position) in the
+    session and the store, and the returns of the portfolio."""
+    with timed_stage("totals", len(df)):
+        st.session_state.summary_df, touched = update_total_position(st.session_state.totals_cache, df, names, fingerprints)
+    with timed_stage("returns", len(df)):
+        st.session_state.returns_df = portfolio_returns(df)
+    if st.session_state.store_signatures is not None and touched:
+        with timed_stage("save totals", len(touched)):
+            write_totals(st.session_state.store_path, st.session_state.summary_df, touched)
+
+
+def index_companies(cache, kind, df):
+    """Indexes the rows and fingerprints of each company in df into the browse cache, unless df was indexed already.
+    Returns whether it was indexed. Only a weak reference to df is kept, so replaced data isn't held on to."""
+    if kind in cache and cache[kind]() is df:
+        return False
+    cache[kind] = weakref.ref(df)
+    cache[f"{kind}_rows"] = company_rows(df)
+    cache[f"{kind}_fingerprints"] = company_fingerprints(df) if not df.empty else pd.Series(dtype="uint64")
+    return True
+
+
+def company_view(name):
+    """Returns the styled rounds of a company and its styled summary (or None if there isn't one yet). The data and
+    summary are indexed by company when they change, and a company's views are reused until its own rows change."""
+    cache = st.session_state.browse_cache
+    edited_df = st.session_state.edited_df
+    summary_df = st.session_state.summary_df
+    if index_companies(cache, "data", edited_df):
+        cache["views"] = {key: view for key, view in cache["views"].items() if key in cache["data_rows"]}
+    index_companies(cache, "summary", summary_df)
+
+    # A company without rows (e.g. renamed since it was chosen) shows an empty table
+    rows = cache["data_rows"].get(name, np.empty(0, dtype=int))
+    fingerprint = (cache["data_fingerprints"].get(name), cache["summary_fingerprints"].get(name))
+    view = cache["views"].get(name)
+    if view is None or view[0] != fingerprint:
+        with timed_stage("style company", len(rows)):
+            if st.session_state.loaded_from_store and st.session_state.store_signatures is not None:
+                # The store holds the same rounds, and looks a company up on its Name rather than scanning the table
+                company_df = read_company(st.session_state.store_path, name)
+            else:
+                company_df = edited_df.iloc[rows]
+            styled_df = style_filtered_data(company_df)
+            styled_summary = None
+            if name in cache["summary_rows"]:
+                styled_summary = style_format(summary_df.iloc[cache["summary_rows"][name]].style, summary_format_style)
+        view = (fingerprint, styled_df, styled_summary)
+        cache["views"][name] = view
+    return view[1], view[2]
+
+
+def edit_window(df):
+    """Edits the rows of the chosen companies, or of a page of companies, sending only those rows to the browser.
+    The edited rows are merged back in place of the rows shown, and the companies that changed are recalculated
+    straight away if chosen. Rows without a Name are shown on every page so they can be named."""
+    rows_by_company = company_rows(df)
+    names = list(rows_by_company)
+    chosen = st.multiselect("Companies", names, placeholder="All companies, a page at a time")
+    if not chosen:
+        left, right = st.columns(2)
+        page_size = left.selectbox("Companies per page", [10, 25, 50, 100], index=1)
+        pages = max(1, -(-len(names) // page_size))
+        page = right.number_input(f"Page (of {pages})", 1, pages, 1)
+        chosen = names[(page - 1) * page_size:page * page_size]
+    rows = np.union1d(window_rows(rows_by_company, chosen), np.flatnonzero(df["Name"].isna().to_numpy()))
+    recalculate_edits = st.checkbox("Recalculate edited companies straight away", value=True)
+    st.caption(f"Editing {len(rows):,} of {len(df):,} rows")
+
+    with timed_stage("render editor", len(rows)):
+        edited = compact(st.data_editor(
+            expand_round_table(df.iloc[rows].reset_index(drop=True)),
+            column_config=column_config,
+            hide_index=True,
+            num_rows="dynamic",
+        ))
+    with timed_stage("merge edits", len(rows)):
+        merged, changed = merge_window(df, rows, edited)
+    if merged is df:
+        return
+    if recalculate_edits and changed:
+        with timed_stage("recalculation (edited companies)", len(edited)):
+            merged = recalculate_companies(merged, changed)
+    save_edits(compact(merged))
+    if recalculate_edits and changed and st.session_state.totals_cache:
+        update_totals(st.session_state.edited_df, changed)
+    # Show the merged and recalculated rows
+    st.rerun()
+
+
+@st.cache_resource(max_entries=4)
+def scenario_draws(simulations, companies, rounds):
+    """Random numbers for the scenarios, drawn once for each size so moving the other sliders only rescales them."""
+    return random_draws(simulations, companies, rounds)
+
+
+def show_round_problems(df):
+    """Warns about rounds listed twice or missing, which the recalculation can't link to the previous round."""
+    problems = round_problems(df)
+    if not problems.empty:
+        st.warning(f"{len(problems)} rounds are listed twice or missing, the rounds after them are not compared to a previous round:")
+        st.dataframe(problems, hide_index=True)
+
+
+def show_violations(df):
+    """Lists the values that break a rule of the recalculation, without recalculating anything."""
+    with timed_stage("check only", len(df)):
+        violations = validate(df)
+    if violations.empty:
+        st.success("All rounds match the rules of the recalculation.")
+    else:
+        st.warning(f"{len(violations)} values don't match what the recalculation expects:")
+        st.dataframe(violations, hide_index=True)
+
+
+pick_up_snapshot()
+
 # --- Sidebar Menu ---
 with st.sidebar:
     st.title("Round Calculator")
     menu_choice = st.radio(
-        "Menu", ["About", "Check & Calculate", "Browse Companies", "Totals"], key="menu_choice_sidebar"
+        "Menu", ["About", "Check & Calculate", "Browse Companies", "Totals", "Scenarios"], key="menu_choice_sidebar"
     )
     if st.session_state.menu_choice != menu_choice:
         st.session_state.menu_choice = menu_choice
+    # Filled in at the end, once the page has loaded the files
+    watch_panel = st.container()
+
+    # --- Timings of this rerun, filled in at the end ---
+    show_timings = st.checkbox("Show timings", key="show_timings")
+    if show_timings:
+        st.session_state.track_memory = st.checkbox(
+            "Track memory (slower)", value=st.session_state.track_memory
+        )
+        st.checkbox("Profile recalculations", key="profile_recalc")
+    timings_panel = st.container()
 
 
 # --- Main App ---
@@ -181,24 +664,60 @@ Version: 0.1.4
 
     if auto_load:
         uploaded_file = "/Users/deepseek/Downloads/Round.csv"
-        st.session_state.edited_df = load_data(uploaded_file)
+    else:
+        # Several files are merged into one portfolio
+        uploaded_file = st.file_uploader("Load Round.csv", type="csv", accept_multiple_files=True) or None
+
+    with st.expander("Merge several files"):
+        folder = st.text_input("Load every .csv file in this folder and its subfolders instead", key="load_folder")
+        if folder:
+            uploaded_file = folder
+        keep_from = st.radio(
+            "Where files share a round (Name, Round #), keep the one from",
+            ["the later file", "the earlier file"],
+            horizontal=True,
+            help="Files in a folder are taken in path order",
+        )
+    precedence = "last" if keep_from == "the later file" else "first"
+
+    st.session_state.float32_ratios = st.checkbox(
+        "Store My Ownership with fewer digits to save memory",
+        value=st.session_state.float32_ratios,
+    )
+
+    if uploaded_file is not None:
+        load_data(uploaded_file, precedence=precedence)
         if not st.session_state.edited_df.empty:
             st.session_state.has_data_file = True
+            if not st.session_state.bad_rows.empty:
+                st.warning(f"{len(st.session_state.bad_rows)} values could not be read, they have been left empty or set to 0:")
+                st.dataframe(st.session_state.bad_rows, hide_index=True)
+            overlapping_rows = st.session_state.overlapping_rows
+            if not overlapping_rows.empty:
+                st.info(f"{len(overlapping_rows)} rounds are also in another file, only the one from {keep_from} is kept. Not kept:")
+                st.dataframe(overlapping_rows[["Source", "Name", "Round #", "Round Name", "Date"]], hide_index=True)
+            show_round_problems(st.session_state.edited_df)
+            if st.session_state.memory_saved is not None:
+                loaded_bytes, saved_bytes = st.session_state.memory_saved
+                st.caption(
+                    f"Held in memory as {(loaded_bytes - saved_bytes) / 2**10:,.0f} KiB, "
+                    f"{saved_bytes / 2**10:,.0f} KiB less than as loaded ({saved_bytes / loaded_bytes:.0%})"
+                )
+            if st.session_state.loaded_from_store:
+                st.info(f"Loaded with the edits saved in {st.session_state.store_path}.")
+                if st.button("Discard saved edits and reload the file"):
+                    load_data(uploaded_file, discard_edits=True, precedence=precedence)
+                    st.rerun()
+            elif st.session_state.store_signatures is not None:
+                st.caption(f"Edits are saved in {st.session_state.store_path} and loaded again with this file.")
+            snapshot = st.session_state.snapshot
+            if snapshot is not None and st.session_state.edited_df is snapshot["rounds"]:
+                st.caption(f"Shared with other sessions as version {snapshot['version']} of the snapshot in {SNAPSHOT_DIR}.")
             st.write("Loaded Data:")
-            st.dataframe(st.session_state.edited_df)
+            with timed_stage("render loaded data", len(st.session_state.edited_df)):
+                st.dataframe(st.session_state.edited_df)
         else:
             st.write("Failed to load")
-    else:
-        uploaded_file = st.file_uploader("Load Round.csv", type="csv")
-
-        if uploaded_file is not None:
-            st.session_state.edited_df = load_data(uploaded_file)
-            if not st.session_state.edited_df.empty:
-                st.session_state.has_data_file = True
-                st.write("Loaded Data:")
-                st.dataframe(st.session_state.edited_df)
-            else:
-                st.write("Failed to load")
 
 elif st.session_state.menu_choice == "Check & Calculate":
     st.header("Check & Calculate", divider=True)
@@ -213,25 +732,54 @@ elif st.session_state.menu_choice == "Check & Calculate":
     )
 
     show_changes = st.session_state.changes_view_option
+    st.session_state.incremental_recalc = st.checkbox(
+        "Only recalculate companies changed since the last recalculation",
+        value=st.session_state.incremental_recalc,
+    )
 
     if st.button("Recalculate Data and Total Position"):
-        st.session_state.edited_df = process_data(st.session_state.edited_df, show_changes)
-        st.session_state.summary_df, summary_df_styled = calculate_and_display_total_position(
-            st.session_state.edited_df
+        if st.session_state.get("profile_recalc"):
+            processed, st.session_state.profile_report = profiled(
+                process_data, st.session_state.edited_df, show_changes
+            )
+        else:
+            processed = process_data(st.session_state.edited_df, show_changes)
+        save_edits(processed)
+        # The incremental recalculation has already fingerprinted the companies of its result
+        update_totals(
+            st.session_state.edited_df,
+            fingerprints=st.session_state.recalc_cache.get("result_fingerprints") if st.session_state.incremental_recalc else None,
         )
+        show_round_problems(st.session_state.edited_df)
+        # Without its recalculation: recalculating the result again isn't a no-op (see recalculate_changed_companies)
+        publish_snapshot({"rounds": st.session_state.edited_df, "summary": st.session_state.summary_df})
+
+    if st.button("Check Only", help="List the values the recalculation would change, without changing them"):
+        show_violations(st.session_state.edited_df)
 
     if "edited_df" in st.session_state:
 
-        if debug_harness: 
-            print("Current Data", st.session_state.edited_df)
+        log.debug("Current Data %s", st.session_state.edited_df)
 
         st.subheader("Edit Data")
-        st.session_state.edited_df = st.data_editor(
-            st.session_state.edited_df,
-            column_config=column_config,
-            hide_index=True,
-            num_rows="dynamic",
-        )
+        if st.toggle(
+            "Edit a few companies at a time",
+            value=len(st.session_state.edited_df) > EDIT_WINDOW_ROWS,
+            help="Only the rows shown are sent to the browser, which keeps editing large portfolios fast",
+        ):
+            edit_window(st.session_state.edited_df)
+        else:
+            with timed_stage("render editor", len(st.session_state.edited_df)):
+                # Edited as plain text so new names can be typed in, and kept compact in between
+                edited = compact(st.data_editor(
+                    expand_round_table(st.session_state.edited_df),
+                    column_config=column_config,
+                    hide_index=True,
+                    num_rows="dynamic",
+                ))
+                # Kept as it is when unchanged, so a table mapped from a snapshot stays shared
+                if not edited.equals(st.session_state.edited_df):
+                    save_edits(edited)
 
 elif st.session_state.menu_choice == "Browse Companies":
     st.header("Browse Companies", divider=True)
@@ -245,8 +793,8 @@ elif st.session_state.menu_choice == "Browse Companies":
     # --- Display Name-Specific Data ---
     st.subheader("View Data by Name")
 
-    # Get unique names
-    unique_names = edited_df["Name"].unique()
+    # Get unique names, leaving out rows not named yet
+    unique_names = edited_df["Name"].dropna().unique()
 
     if "name_state" not in st.session_state:
         st.session_state.name_state = {name: False for name in unique_names}
@@ -256,21 +804,16 @@ elif st.session_state.menu_choice == "Browse Companies":
         "Select a Name to view:", unique_names, key="name_select_radio", horizontal=True
     )
     if selected_name:
-        # Filter edited_df for the current name
-        filtered_edited_df = edited_df[edited_df["Name"] == selected_name]
-
-        # Apply the styling
-        styled_df = style_filtered_data(filtered_edited_df)
+        # The rows and summary of the company, styled once until they change
+        styled_df, filtered_summary_df = company_view(selected_name)
 
-        st.write(f"Data for: {selected_name}")
-        st.dataframe(styled_df)
+        with timed_stage("render company", len(styled_df.data)):
+            st.write(f"Data for: {selected_name}")
+            st.dataframe(styled_df)
 
-        # Filter summary_df for the current name
         if not summary_df.empty:
-            filtered_summary_df = summary_df[summary_df["Name"] == selected_name]
-            if not filtered_summary_df.empty:
+            if filtered_summary_df is not None:
                 st.write(f"Summary Data for: {selected_name}")
-                filtered_summary_df = filtered_summary_df.style.format(summary_format_style)
                 st.dataframe(filtered_summary_df)
             else:
                 st.write(f"No summary data found for: {selected_name}")
@@ -282,10 +825,9 @@ elif st.session_state.menu_choice == "Browse Companies":
         # --- New row functionality with Round # sequence ---
         if st.button("Add New Row"):
             new_row = add_new_row(st.session_state.edited_df)
-            st.session_state.edited_df = pd.concat(
-                [st.session_state.edited_df, new_row], ignore_index=True
-            )
-            st.session_state.edited_df = process_data(st.session_state.edited_df)
+            save_edits(process_data(pd.concat([st.session_state.edited_df, new_row], ignore_index=True)))
+            if st.session_state.totals_cache:
+                update_totals(st.session_state.edited_df)
             st.rerun()
 
 elif st.session_state.menu_choice == "Totals":
@@ -301,5 +843,121 @@ elif st.session_state.menu_choice == "Totals":
             )
     else :
         summary_df = st.session_state.summary_df
-        summary_df_styled = summary_df.style.format(summary_format_style)
-        st.dataframe(summary_df_styled, hide_index=True)
\ No newline at end of file
+        totals = st.session_state.totals_cache.get("totals")
+        if totals is None:
+            totals = portfolio_totals(summary_df)
+        for column, (label, value) in zip(st.columns(4), [
+            ("Companies", f"{totals['Companies']:,.0f}"),
+            ("Rounds", f"{totals['Rounds']:,.0f}"),
+            ("Total Invested", format_currency(totals["Total_Invested"])),
+            ("Total Value", format_currency(totals["Total_Value"])),
+        ]):
+            column.metric(label, value)
+        with timed_stage("render totals", len(summary_df)):
+            summary_df_styled = style_format(summary_df.style, summary_format_style)
+            st.dataframe(summary_df_styled, hide_index=True)
+        st.download_button(
+            "Download totals as shown",
+            format_table(summary_df, summary_format_style).to_csv(index=False),
+            file_name="totals.csv",
+            mime="text/csv",
+        )
+
+        st.subheader("Returns")
+        st.write(
+            "Each amount invested is taken as paid on the date of its round and the value of the position as received "
+            "today. Without distributions or fees in the data, TVPI and MOIC are the same multiple."
+        )
+        if st.session_state.returns_df is None:
+            with timed_stage("returns", len(st.session_state.edited_df)):
+                st.session_state.returns_df = portfolio_returns(st.session_state.edited_df)
+        returns_df = st.session_state.returns_df
+        fund = returns_df.iloc[-1]
+        for column, (label, value) in zip(st.columns(3), [
+            ("Fund TVPI", format_multiple(fund["TVPI"])),
+            ("Fund MOIC", format_multiple(fund["MOIC"])),
+            ("Fund XIRR", format_percentage(fund["XIRR"])),
+        ]):
+            column.metric(label, value)
+        with timed_stage("render returns", len(returns_df)):
+            st.dataframe(style_format(returns_df.style, returns_format_style), hide_index=True)
+
+        st.subheader("Export")
+        st.write(
+            "Writes the round table, the totals above and the changes of the last recalculation to files in a folder, "
+            "with numbers and dates as they are held rather than as shown, for use in other tools."
+        )
+        export_folder = st.text_input("Folder", EXPORT_DIR, key="export_folder")
+        export_formats = st.multiselect("Formats", EXPORT_FORMATS, EXPORT_FORMATS, key="export_formats")
+        st.caption("Excel files take much longer to write than CSV or Parquet for large portfolios.")
+        if st.button("Export", disabled=not export_formats):
+            tables = {"rounds": st.session_state.edited_df, "totals": summary_df, "changes": st.session_state.change_set}
+            try:
+                with timed_stage("export", sum(len(df) for df in tables.values())):
+                    paths = export_tables(tables, export_folder, export_formats)
+            except (OSError, ImportError, ValueError) as e:
+                st.error(f"Could not export: {e}")
+            else:
+                st.success(f"Exported {len(paths)} files:")
+                st.dataframe(
+                    pd.DataFrame({"File": paths, "Size (KB)": [os.path.getsize(path) // 1024 for path in paths]}),
+                    hide_index=True,
+                )
+
+elif st.session_state.menu_choice == "Scenarios":
+    st.header("Scenarios", divider=True)
+    st.write(
+        "Projects each company through more rounds, each stepping the valuation up and selling part of the company, "
+        "and shows the spread of the value and ownership of the position over many simulated futures."
+    )
+    if not st.session_state.has_data_file:
+        st.warning("Please load data in the 'About' section first.")
+        st.stop()
+
+    left, right = st.columns(2)
+    with left:
+        rounds = st.slider("Future rounds", 0, 10, 3)
+        step_up_median = st.slider("Typical step-up per round (x)", 1.0, 5.0, 2.0, 0.1)
+        step_up_spread = st.slider("Step-up uncertainty (log standard deviation)", 0.0, 1.5, 0.5, 0.05)
+    with right:
+        round_size_low, round_size_high = st.slider("Share of the company sold per round", 0.0, 0.5, (0.10, 0.25), 0.01)
+        failure_rate = st.slider("Chance of failing per round", 0.0, 0.5, 0.0, 0.01)
+        simulations = st.select_slider("Simulations", [500, 1000, 2000, 5000], 2000)
+
+    with timed_stage("scenarios", len(st.session_state.edited_df)) as stage:
+        positions = current_positions(st.session_state.edited_df)
+        values, ownership = simulate(
+            positions,
+            rounds=rounds,
+            step_up_median=step_up_median,
+            step_up_spread=step_up_spread,
+            round_size_low=round_size_low,
+            round_size_high=round_size_high,
+            failure_rate=failure_rate,
+            draws=scenario_draws(simulations, len(positions), rounds),
+        )
+        bands = percentile_bands(positions, values, ownership)
+        stage["Rows"] = values.size
+
+    total = bands.iloc[-1]
+    for column, percentile in zip(st.columns(len(PERCENTILES)), PERCENTILES):
+        column.metric(f"Total value P{percentile}", format_currency(total[f"Value P{percentile}"]))
+    scenario_format_style = {col: format_currency_values for col in bands.columns if col.startswith(("Invested", "Value"))}
+    scenario_format_style.update({col: format_percentage_values for col in bands.columns if col.startswith("Ownership")})
+    st.dataframe(style_format(bands.style, scenario_format_style), hide_index=True)
+
+# --- Watching the loaded files ---
+with watch_panel:
+    if st.session_state.watched is not None and st.checkbox(
+        "Watch the loaded file for changes", value=True, key="watch_files",
+        help=f"Checks every {WATCH_SECONDS} seconds and takes in only the rounds that changed",
+    ):
+        watch_sources()
+
+# --- Timings Panel ---
+if show_timings:
+    with timings_panel:
+        st.dataframe(timings_frame(st.session_state.timings), hide_index=True)
+        if st.session_state.profile_report:
+            with st.expander("Profile of the last profiled recalculation"):
+                st.code(st.session_state.profile_report)
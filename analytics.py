@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+
+# Returns of the portfolio from the round table: each Invested amount is a cash flow out on the Date of its round, and
+# the current value of the position (the sum of Increase (Value)) comes back on the valuation date. There are no
+# distributions or fees in the round table, so TVPI (total value over paid-in) and MOIC (multiple on invested capital)
+# are the same multiple, for each company and for the fund.
+
+RETURN_COLUMNS = ["Name", "Invested", "Value", "First Investment", "TVPI", "MOIC", "XIRR"]
+
+# The XIRR is found to this precision in log(1 + rate) within at most this many steps
+XIRR_TOLERANCE = 1e-10
+XIRR_MAX_STEPS = 100
+
+# log(1 + rate) is looked for between these, i.e. rates from -99.995% to about 147x a year
+LOG_RATE_LOW = -10.0
+LOG_RATE_HIGH = 5.0
+
+
+def xirr(amounts, years, values):
+    """Solves the XIRR of many investments at once. amounts and years are (investments, flows) arrays of the amounts
+    invested (0 for padding) and the years from each one to the valuation date, values the value of each investment on
+    that date. Returns the annual rates, NaN where there's nothing invested or no time passed, -1 where the value is 0.
+
+    With x = log(1 + rate) the log of the invested amounts grown to the valuation date, log(sum(amount * exp(x *
+    years))), is convex and rises with x, so it meets log(value) once. Newton's method finds where for all investments
+    at once, bisecting inside a bracket kept around the root whenever a step would leave it. Rates outside the bracket
+    are given as its ends."""
+    amounts = np.asarray(amounts, dtype=float)
+    years = np.maximum(np.asarray(years, dtype=float), 0.0)  # Rounds after the valuation date count as on it
+    values = np.asarray(values, dtype=float)
+
+    def gap(x, rows):
+        """How far the log of the grown amounts of rows is above the log of their value at x, and its slope."""
+        grown = amounts[rows] * np.exp(x[:, None] * years[rows])
+        total = grown.sum(axis=1)
+        return np.log(total) - np.log(values[rows]), (grown * years[rows]).sum(axis=1) / total
+
+    invested = amounts.sum(axis=1)
+    solvable = (invested > 0) & ((amounts * years).sum(axis=1) > 0) & (values > 0) & np.isfinite(values)
+    low = np.full(len(values), LOG_RATE_LOW)
+    high = np.full(len(values), LOG_RATE_HIGH)
+    x = np.zeros(len(values))
+    with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+        below = np.zeros(len(values), dtype=bool)
+        below[solvable] = gap(low[solvable], solvable)[0] >= 0
+        above = np.zeros(len(values), dtype=bool)
+        above[solvable] = gap(high[solvable], solvable)[0] <= 0
+        x[below], x[above] = LOG_RATE_LOW, LOG_RATE_HIGH
+        active = solvable & ~below & ~above
+        # Start from the rate that would turn the multiple into the value over the average time invested
+        duration = (amounts[active] * years[active]).sum(axis=1) / invested[active]
+        x[active] = np.clip(np.log(values[active] / invested[active]) / duration, LOG_RATE_LOW, LOG_RATE_HIGH)
+        for _ in range(XIRR_MAX_STEPS):
+            if not active.any():
+                break
+            distance, slope = gap(x[active], active)
+            # The gap rises with x, so the root is above x where it's negative
+            low[active] = np.where(distance < 0, x[active], low[active])
+            high[active] = np.where(distance < 0, high[active], x[active])
+            step = x[active] - distance / slope
+            inside = np.isfinite(step) & (step >= low[active]) & (step <= high[active])
+            new_x = np.where(inside, step, (low[active] + high[active]) / 2)
+            done = (np.abs(new_x - x[active]) < XIRR_TOLERANCE) | (high[active] - low[active] < XIRR_TOLERANCE)
+            x[active] = new_x
+            active[np.flatnonzero(active)[done]] = False
+
+    rates = np.where(solvable, np.expm1(x), np.nan)
+    # A position that is worth nothing lost everything
+    rates[(invested > 0) & (values == 0)] = -1.0
+    return rates
+
+
+def cash_flows(df, as_of):
+    """Returns the investments of each company of df as padded (companies, flows) arrays of amounts and years to
+    as_of, with the Names of the companies and the date of their first investment."""
+    invested = df["Invested"].astype(float).to_numpy()
+    dates = pd.to_datetime(df["Date"]).to_numpy(dtype="datetime64[ns]")
+    codes, names = pd.factorize(df["Name"])
+    rows = np.flatnonzero((codes >= 0) & (invested > 0) & ~np.isnat(dates))
+    row_codes = codes[rows]
+    # Position of each investment within its company
+    order = np.argsort(row_codes, kind="stable")
+    counts = np.bincount(row_codes, minlength=len(names))
+    starts = np.cumsum(counts) - counts
+    positions = np.empty(len(rows), dtype=np.intp)
+    positions[order] = np.arange(len(rows)) - np.repeat(starts, counts)
+
+    amounts = np.zeros((len(names), counts.max(initial=0)))
+    years = np.zeros_like(amounts)
+    amounts[row_codes, positions] = invested[rows]
+    years[row_codes, positions] = (np.datetime64(as_of, "ns") - dates[rows]) / np.timedelta64(1, "D") / 365.0
+    first_investment = pd.Series(dates[rows]).groupby(row_codes).min().reindex(range(len(names))).to_numpy()
+    return names, amounts, years, first_investment
+
+
+def portfolio_returns(df, as_of=None):
+    """Returns the TVPI, MOIC and XIRR of each company of a recalculated round table and of the whole fund (a last
+    'Total' row), valuing the positions on as_of (default: today). Companies whose value can't be calculated are left
+    out of the total."""
+    as_of = pd.Timestamp.today().normalize() if as_of is None else pd.Timestamp(as_of)
+    names, amounts, years, first_investment = cash_flows(df, as_of)
+    codes = pd.factorize(df["Name"])[0]
+    named = codes >= 0
+    values = np.bincount(codes[named], df["Increase (Value)"].astype(float).to_numpy()[named], minlength=len(names))
+    invested = amounts.sum(axis=1)
+    rates = xirr(amounts, years, values)
+
+    # The fund invests every amount and holds the value of every company it can value
+    valued = np.isfinite(values)
+    fund_amounts = amounts[valued][amounts[valued] > 0]
+    fund_years = years[valued][amounts[valued] > 0]
+    fund_value = values[valued].sum()
+    fund_rate = xirr(fund_amounts[None, :], fund_years[None, :], [fund_value])[0]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        multiples = np.append(values / invested, fund_value / invested[valued].sum())
+    returns = pd.DataFrame({
+        "Name": list(names) + ["Total"],
+        "Invested": np.append(invested, invested.sum()),
+        "Value": np.append(values, fund_value),
+        "First Investment": np.append(first_investment, pd.Series(first_investment).min()).astype("datetime64[ns]"),
+        "TVPI": multiples,
+        "MOIC": multiples,
+        "XIRR": np.append(rates, fund_rate),
+    })
+    return returns[RETURN_COLUMNS]
@@ -0,0 +1,174 @@
+"""Recalculates Round.csv exports from the command line, without Streamlit.
+
+Each input file is loaded, recalculated and written out as <name>_recalculated.csv (the round table) and
+<name>_totals.csv (the total position per company). Several files are processed in parallel across processes, and
+a single file is recalculated in batches of companies across processes. --check only lists the values that break a
+rule of the recalculation, without writing anything, and fails if there are any. --convert only checks the values
+can be read and converts each file to <name>.parquet a chunk of rows at a time, for files too large to load whole.
+--timings prints the time, rows and peak memory of each stage per file, --profile the top functions of each file.
+
+    python batch.py Fund1/Round.csv Fund2/Round.csv --output-dir out --workers 4
+    python batch.py Fund1/Round.csv --check
+    python batch.py Huge/Round.csv --convert --chunksize 500000
+"""
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from calculations import calculate_total_position, process_data_parallel, round_problems
+from loading import convert_round_csv, read_round_csv
+from timing import profiled, timed, timings_frame
+from validation import validate
+
+
+def output_paths(input_paths, output_dir=None):
+    """Returns the (recalculated, totals) output paths for each input. Outputs go next to the input unless output_dir
+    is given, in which case inputs with the same file name are told apart by their folder name."""
+    stems = [os.path.splitext(os.path.basename(path))[0] for path in input_paths]
+    paths = []
+    for path, stem in zip(input_paths, stems):
+        if output_dir is None:
+            folder = os.path.dirname(path)
+        else:
+            folder = output_dir
+            if stems.count(stem) > 1:
+                stem = f"{os.path.basename(os.path.dirname(os.path.abspath(path)))}_{stem}"
+        paths.append((os.path.join(folder, f"{stem}_recalculated.csv"), os.path.join(folder, f"{stem}_totals.csv")))
+    return paths
+
+
+def converted_paths(input_paths, output_dir=None):
+    """Returns the Parquet output path of each input for --convert, named and placed like output_paths."""
+    return [recalculated[:-len("_recalculated.csv")] + ".parquet" for recalculated, _ in output_paths(input_paths, output_dir)]
+
+
+def recalculate_file(input_path, recalculated_path, totals_path, timings=None, trace_memory=False, workers=1):
+    """Loads, recalculates (on workers processes if it is large enough) and writes one Round.csv file. Returns the number
+    of rounds, the number of companies, the report of values that could not be read and the rounds listed twice or
+    missing. If timings (a list) is given, the stages are timed into it."""
+    timings = [] if timings is None else timings
+    with timed(timings, "load", trace_memory=trace_memory) as stage:
+        df, bad_rows = read_round_csv(input_path)
+        stage["Rows"] = len(df)
+    problems = round_problems(df)
+    with timed(timings, "recalculation", len(df), trace_memory):
+        df = process_data_parallel(df, workers)
+    with timed(timings, "totals", len(df), trace_memory):
+        summary_df = calculate_total_position(df)
+    with timed(timings, "write", len(df), trace_memory):
+        df.to_csv(recalculated_path, index=False)
+        summary_df.to_csv(totals_path, index=False)
+    return len(df), len(summary_df), bad_rows, problems
+
+
+def check_file(input_path, recalculated_path, totals_path, timings=None, trace_memory=False, workers=1):
+    """Loads one Round.csv file and checks it against the rules of the recalculation without changing or writing
+    anything. Returns the number of rounds, the violations (see validation.validate), the report of values that could
+    not be read and the rounds listed twice or missing. Takes the same arguments as recalculate_file."""
+    timings = [] if timings is None else timings
+    with timed(timings, "load", trace_memory=trace_memory) as stage:
+        df, bad_rows = read_round_csv(input_path)
+        stage["Rows"] = len(df)
+    problems = round_problems(df)
+    with timed(timings, "check", len(df), trace_memory):
+        violations = validate(df)
+    return len(df), violations, bad_rows, problems
+
+
+def convert_file(input_path, parquet_path, timings=None, trace_memory=False, workers=1, chunksize=100_000):
+    """Converts one Round.csv file to Parquet chunksize rows at a time (see loading.convert_round_csv), so only a
+    chunk is ever in memory. Returns the report of values that could not be read. workers is not used, a file is
+    converted in order."""
+    timings = [] if timings is None else timings
+    with timed(timings, "convert", trace_memory=trace_memory):
+        return convert_round_csv(input_path, parquet_path, chunksize)
+
+
+def run_job(job, trace_memory=False, profile=False, workers=1, check=False, chunksize=None):
+    """Runs recalculate_file (or check_file if check) for one (input, recalculated, totals) job, or convert_file for
+    one (input, parquet) job if chunksize is given, returning (job, result, error message, timings, profile report or
+    None)."""
+    timings = []
+    report = None
+    if chunksize is not None:
+        run_file = partial(convert_file, chunksize=chunksize)
+    else:
+        run_file = check_file if check else recalculate_file
+    try:
+        if profile:
+            result, report = profiled(run_file, *job, timings, trace_memory, workers)
+        else:
+            result = run_file(*job, timings, trace_memory, workers)
+        return job, result, None, timings, report
+    except Exception as exc:
+        return job, None, f"{type(exc).__name__}: {exc}", timings, report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recalculate Round.csv exports and write the totals per company.")
+    parser.add_argument("inputs", nargs="+", help="Round.csv files to recalculate")
+    parser.add_argument("--output-dir", help="folder for the output files (default: next to each input)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes (default: all cores)")
+    parser.add_argument("--timings", action="store_true", help="print the time, rows and peak memory of each stage")
+    parser.add_argument("--profile", action="store_true", help="print the functions that took longest for each file")
+    parser.add_argument("--check", action="store_true",
+                        help="only list the values that break a rule of the recalculation, and fail if there are any")
+    parser.add_argument("--convert", action="store_true",
+                        help="only convert each file to <name>.parquet a chunk at a time, listing values that can't be read")
+    parser.add_argument("--chunksize", type=int, default=100_000, help="rows converted at a time with --convert")
+    args = parser.parse_args(argv)
+
+    if args.output_dir is not None and not args.check:
+        os.makedirs(args.output_dir, exist_ok=True)
+    if args.convert:
+        jobs = list(zip(args.inputs, converted_paths(args.inputs, args.output_dir)))
+    else:
+        jobs = [(path, *outputs) for path, outputs in zip(args.inputs, output_paths(args.inputs, args.output_dir))]
+
+    workers = max(1, min(args.workers, len(jobs)))
+    # The workers go to the files, or to the companies of a single file
+    company_workers = args.workers if len(jobs) == 1 else 1
+    run = partial(run_job, trace_memory=args.timings, profile=args.profile, workers=company_workers,
+                  check=args.check, chunksize=args.chunksize if args.convert else None)
+    if workers == 1:
+        results = [run(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(run, jobs))
+
+    failed = 0
+    for job, result, error, timings, report in results:
+        if args.timings:
+            print(f"{job[0]}: stage timings\n{timings_frame(timings).to_string(index=False)}", file=sys.stderr)
+        if report is not None:
+            print(f"{job[0]}: profile\n{report}", file=sys.stderr)
+        if error is not None:
+            failed += 1
+            print(f"{job[0]}: failed with {error}", file=sys.stderr)
+        else:
+            # Rounds listed twice or missing are only found with the whole file loaded
+            problems = None
+            if args.convert:
+                bad_rows = result
+                print(f"{job[0]}: converted -> {job[1]}")
+            elif args.check:
+                rounds, violations, bad_rows, problems = result
+                print(f"{job[0]}: {rounds} rounds, {len(violations)} values break a rule")
+                for row in violations.itertuples(index=False):
+                    print(f"{job[0]}: {row.Name} round {row[1]} {row.Column} {row.Value:g}, expected {row.Expected:g} ({row.Rule})")
+                failed += not violations.empty
+            else:
+                rounds, companies, bad_rows, problems = result
+                print(f"{job[0]}: {rounds} rounds, {companies} companies -> {job[1]}, {job[2]}")
+            for row in bad_rows.itertuples(index=False):
+                print(f"{job[0]}:{row.Line}: {row.Column} {row.Value!r} {row.Problem}", file=sys.stderr)
+            if problems is not None:
+                for row in problems.itertuples(index=False):
+                    print(f"{job[0]}: {row.Name} round {row[1]} {row.Problem}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
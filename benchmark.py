@@ -0,0 +1,155 @@
+"""Times the loading and calculation stages on synthetic portfolios and checks them against a stored baseline.
+
+Each stage is run at several scales (companies x rounds per company). The best wall time of a few runs, the throughput
+in rows per second and the peak memory allocated while it runs are reported. A stage that takes longer or needs more
+memory than the baseline by more than the tolerance fails the run.
+
+    python benchmark.py                      # compare against benchmark_baseline.json
+    python benchmark.py --save-baseline      # store the results as the new baseline
+    python benchmark.py --scales 100x8 50000x10 --repeat 5
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from calculations import (
+    calculate_increase_value,
+    calculate_total_position,
+    process_data,
+    process_data_parallel,
+    update_calculated_columns,
+)
+from loading import read_round_csv
+from synthetic import generate_round_table, write_round_csv
+
+DEFAULT_SCALES = ["100x8", "1000x8", "10000x10"]
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+# Stages faster than this are too noisy to fail on
+MIN_SECONDS = 0.005
+
+
+def parse_scale(scale):
+    companies, rounds = scale.lower().split("x")
+    return int(companies), int(rounds)
+
+
+def stages(csv_path, df, processed, engine):
+    """Returns (name, function) for each stage. Every function works on its own copy of the input."""
+    return [
+        ("load", lambda: read_round_csv(csv_path, engine)),
+        ("update_calculated_columns", lambda: update_calculated_columns(df.copy())),
+        ("calculate_increase_value", lambda: calculate_increase_value(df.copy())),
+        ("calculate_total_position", lambda: calculate_total_position(processed.copy())),
+        ("process_data", lambda: process_data(df.copy())),
+        ("process_data_parallel", lambda: process_data_parallel(df.copy(), min_rows=0)),
+    ]
+
+
+def measure(function, repeat):
+    """Returns the best wall time of repeat runs and the peak memory of one more run traced with tracemalloc, which is
+    run separately since tracing slows everything down."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def run(scales, repeat=3, engine="pyarrow", seed=0):
+    """Runs every stage at every scale. Returns {"<companies>x<rounds>": {stage: {rows, seconds, rows_per_sec, peak_bytes}}}."""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for scale in scales:
+            companies, rounds = parse_scale(scale)
+            df = generate_round_table(companies, rounds, seed)
+            csv_path = os.path.join(tmp, f"Round_{scale}.csv")
+            write_round_csv(df, csv_path)
+            df, _ = read_round_csv(csv_path, engine)
+            processed = process_data(df.copy())
+            results[scale] = {}
+            for name, function in stages(csv_path, df, processed, engine):
+                seconds, peak = measure(function, repeat)
+                results[scale][name] = {
+                    "rows": len(df),
+                    "seconds": seconds,
+                    "rows_per_sec": len(df) / seconds if seconds else float("inf"),
+                    "peak_bytes": peak,
+                }
+    return results
+
+
+def regressions(results, baseline, tolerance):
+    """Lists a message for each stage that is slower or uses more memory than its baseline by more than tolerance
+    (a fraction). Stages without a baseline aren't checked."""
+    messages = []
+    for scale, stage_results in results.items():
+        for name, result in stage_results.items():
+            previous = baseline.get(scale, {}).get(name)
+            if previous is None:
+                continue
+            limit = previous["seconds"] * (1 + tolerance)
+            if result["seconds"] > limit and result["seconds"] - previous["seconds"] > MIN_SECONDS:
+                messages.append(f"{scale} {name}: {result['seconds']:.4f}s, baseline {previous['seconds']:.4f}s")
+            if result["peak_bytes"] > previous["peak_bytes"] * (1 + tolerance):
+                messages.append(f"{scale} {name}: peak {result['peak_bytes'] / 2**20:.1f} MiB, "
+                                f"baseline {previous['peak_bytes'] / 2**20:.1f} MiB")
+    return messages
+
+
+def print_results(results, baseline):
+    print(f"{'scale':>10} {'stage':<26} {'rows':>8} {'seconds':>9} {'rows/sec':>12} {'peak MiB':>9} {'vs baseline':>11}")
+    for scale, stage_results in results.items():
+        for name, result in stage_results.items():
+            previous = baseline.get(scale, {}).get(name)
+            change = f"{result['seconds'] / previous['seconds'] - 1:+.0%}" if previous else ""
+            print(f"{scale:>10} {name:<26} {result['rows']:>8} {result['seconds']:>9.4f} "
+                  f"{result['rows_per_sec']:>12,.0f} {result['peak_bytes'] / 2**20:>9.1f} {change:>11}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the loading and calculation stages on synthetic portfolios.")
+    parser.add_argument("--scales", nargs="+", default=DEFAULT_SCALES, help="<companies>x<rounds> (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage, the best is kept (default: %(default)s)")
+    parser.add_argument("--engine", default="pyarrow", help="pandas.read_csv engine for the load stage (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the synthetic data (default: %(default)s)")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline file (default: %(default)s)")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown or memory growth over the baseline, as a fraction (default: %(default)s)")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the baseline instead of comparing")
+    args = parser.parse_args(argv)
+
+    results = run(args.scales, args.repeat, args.engine, args.seed)
+
+    baseline = {}
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    failures = regressions(results, baseline, args.tolerance)
+    for message in failures:
+        print(f"Regression: {message}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
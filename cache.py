@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import pandas as pd
+
+from calculations import process_data
+from loading import BAD_ROW_COLUMNS, read_round_csv, read_round_csvs, round_csv_paths, source_labels
+
+# On-disk cache of loaded and recalculated portfolios as Parquet, keyed on the content of the source file, so that
+# reruns, page switches and new sessions don't parse or recalculate a file that hasn't changed
+
+CACHE_DIR = os.environ.get("ROUNDCALC_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "roundcalc"))
+
+# Oldest entries are removed once the cache is bigger than this
+MAX_CACHE_BYTES = int(os.environ.get("ROUNDCALC_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+# Change when the loading or calculation changes, so older cached results aren't used
+CACHE_VERSION = "4"
+
+# Remembers the content hash of each path by size and modification time, so unchanged files aren't read to hash them
+INDEX_FILE = "index.json"
+
+
+def content_hash(data):
+    """Returns the cache key for the bytes of a source file."""
+    return hashlib.sha256(data).hexdigest()[:32] + "-v" + CACHE_VERSION
+
+
+def source_key(source, cache_dir=CACHE_DIR):
+    """Returns the cache key of source, a path or an uploaded file-like object. For paths the key is looked up by size
+    and modification time first, and the file is only hashed if either changed."""
+    if not isinstance(source, (str, os.PathLike)):
+        data = source.getvalue() if hasattr(source, "getvalue") else source.read()
+        if hasattr(source, "seek"):
+            source.seek(0)
+        return content_hash(data)
+
+    path = os.path.abspath(source)
+    stat = os.stat(path)
+    index = read_index(cache_dir)
+    entry = index.get(path)
+    if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns and entry["key"].endswith("-v" + CACHE_VERSION):
+        return entry["key"]
+    with open(path, "rb") as f:
+        key = content_hash(f.read())
+    index[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "key": key}
+    write_index(index, cache_dir)
+    return key
+
+
+def read_index(cache_dir=CACHE_DIR):
+    try:
+        with open(os.path.join(cache_dir, INDEX_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_index(index, cache_dir=CACHE_DIR):
+    def write(tmp):
+        with open(tmp, "w") as f:
+            json.dump(index, f)
+    write_atomically(os.path.join(cache_dir, INDEX_FILE), write)
+
+
+def write_atomically(path, write):
+    """Calls write with a temporary path next to path and moves the result into place, so readers in other sessions
+    never see a partly written file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def cache_path(key, kind, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, f"{key}_{kind}.parquet")
+
+
+def read_cached(key, kind, cache_dir=CACHE_DIR):
+    """Returns the cached frame, or None if it isn't in the cache."""
+    path = cache_path(key, kind, cache_dir)
+    try:
+        df = pd.read_parquet(path)
+        os.utime(path)  # Recently used entries are evicted last
+    except (OSError, ValueError):
+        return None
+    return df
+
+
+def write_cached(key, kind, df, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+    write_atomically(cache_path(key, kind, cache_dir), lambda tmp: df.to_parquet(tmp, index=False))
+    evict(cache_dir, max_bytes)
+
+
+def evict(cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+    """Removes the least recently used cache files until the cache is no bigger than max_bytes."""
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(".parquet"):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+
+def load_round_csv_cached(source, engine=None, cache_dir=CACHE_DIR):
+    """Loads a Round.csv export like loading.read_round_csv, from the cache if this content was loaded before.
+    Returns the cache key, the round table and the report of values that could not be read."""
+    key = source_key(source, cache_dir)
+    df = read_cached(key, "loaded", cache_dir)
+    bad_rows = read_cached(key, "bad_rows", cache_dir)
+    if df is None or bad_rows is None:
+        df, bad_rows = read_round_csv(source, engine)
+        write_cached(key, "loaded", df, cache_dir)
+        # Values of any type were read from the file, keep them as text
+        write_cached(key, "bad_rows", bad_rows.astype({"Column": str, "Value": str}), cache_dir)
+    return key, df, bad_rows.reindex(columns=BAD_ROW_COLUMNS)
+
+
+def sources_key(sources, precedence="last", cache_dir=CACHE_DIR):
+    """Returns the cache key of several sources merged with loading.merge_round_tables, which changes with the content
+    and labels of the files and the precedence."""
+    keys = [source_key(source, cache_dir) for source in sources]
+    return content_hash("\n".join(keys + source_labels(sources) + [repr(precedence)]).encode())
+
+
+def load_round_csvs_cached(sources, engine=None, precedence="last", cache_dir=CACHE_DIR):
+    """Loads several Round.csv exports, or every .csv file in a folder, like loading.read_round_csvs, each file from
+    the cache if it was loaded before. Returns the cache key of the merged table, the merged table, the report of
+    values that could not be read and the rows dropped as overlapping."""
+    sources = round_csv_paths(sources) if isinstance(sources, (str, os.PathLike)) else list(sources)
+    df, bad_rows, dropped = read_round_csvs(
+        sources, engine, precedence, read=lambda source: load_round_csv_cached(source, engine, cache_dir)[1:]
+    )
+    return sources_key(sources, precedence, cache_dir), df, bad_rows, dropped
+
+
+def process_data_cached(key, df, cache_dir=CACHE_DIR):
+    """Returns calculations.process_data(df) for the round table loaded with key, from the cache if it was calculated before."""
+    processed = read_cached(key, "processed", cache_dir)
+    if processed is None:
+        processed = process_data(df)
+        write_cached(key, "processed", processed, cache_dir)
+    return processed
@@ -0,0 +1,475 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import numpy as np
+
+# Pure calculation of the round table, without any Streamlit so it can be used from scripts and worker processes
+
+# Debug output of the intermediate frames, e.g. logging.getLogger("roundcalc").setLevel(logging.DEBUG)
+log = logging.getLogger("roundcalc")
+
+# Columns the recalculation rewrites and copies back into the round table
+CALCULATED_COLUMNS = ['Premoney', 'Post Money', 'Round Ownership', 'My Ownership', 'Increase (round/round)', 'Dilution (est)']
+
+CHANGE_LOG_COLUMNS = ["Name", "Round #", "Column", "Old", "New", "Change %"]
+
+ROUND_PROBLEM_COLUMNS = ["Name", "Round #", "Problem"]
+
+# Columns of the total positions that are summed over the portfolio
+PORTFOLIO_TOTAL_COLUMNS = ["Rounds", "Total_Invested", "Total_Value"]
+
+# Below this many rows process_data_parallel recalculates in this process, as starting workers and copying the rows
+# to them takes longer than the recalculation
+PARALLEL_MIN_ROWS = 200_000
+
+def company_round_order(df):
+    """Returns the row positions of df sorted by company (in order of first appearance) then Round #, and the Name and
+    Round # (as floats) in that order. In this order each company's rounds are consecutive, so the previous round of a
+    row is the row before it when it has the same Name and a Round # one lower."""
+    round_number = df["Round #"].astype(float)
+    order = np.lexsort((round_number.to_numpy(), df["Name"].factorize()[0]))
+    return order, df["Name"].iloc[order].reset_index(drop=True), round_number.iloc[order].reset_index(drop=True)
+
+def round_problems(df):
+    """Lists the rounds the recalculation can't link up: a Round # listed more than once for a company, and round numbers
+    missing before a company's last round (those rounds get no Increase (round/round) or Dilution (est))."""
+    _, names, rounds = company_round_order(df)
+    named = (names.notna() & rounds.notna()).to_numpy()
+    names = names.to_numpy()[named]
+    rounds = rounds.to_numpy()[named]
+    companies = pd.factorize(names)[0]
+    same_company = np.r_[False, companies[1:] == companies[:-1]]
+    previous = np.r_[np.nan, rounds[:-1]]
+
+    duplicated = np.flatnonzero(same_company & (rounds == previous))
+    # Rounds between the previous round of the company (or 0 for its first) and this one
+    gap_start = np.where(same_company, previous, 0.0) + 1
+    gap_size = np.clip(rounds - gap_start, 0, None).astype(int)
+    gaps = np.repeat(np.arange(len(rounds)), gap_size)
+    offsets = np.arange(len(gaps)) - np.repeat(np.cumsum(gap_size) - gap_size, gap_size)
+
+    # Sorted by company and round already, so the problems stay in that order by the row they were found at
+    problems = pd.DataFrame({
+        "Row": np.r_[duplicated, gaps],
+        "Name": np.r_[names[duplicated], names[gaps]],
+        "Round #": np.r_[rounds[duplicated], gap_start[gaps] + offsets].astype("int64"),
+        "Problem": ["listed more than once"] * len(duplicated) + ["missing"] * len(gaps),
+    })
+    problems = problems.drop_duplicates(["Name", "Round #", "Problem"])
+    return problems.sort_values(["Row", "Round #"], kind="stable", ignore_index=True)[ROUND_PROBLEM_COLUMNS]
+
+def recalculate_rounds(df):
+    """ Columnar version of the per-company checks and fixes. Returns a copy of df (which must not contain the 'Total' row)
+    with Total Invested, Premoney, Post Money, Round Ownership, My Ownership, Increase (round/round) and Dilution (est) recalculated.
+    Each company's rounds are expected in Round # order, one row per round.
+    """
+    result = df.copy()
+    if result.empty:
+        return result
+
+    total_invested = result["Total Invested"].astype(float)
+    premoney = result["Premoney"].astype(float)
+    post_money = result["Post Money"].astype(float)
+    round_ownership = result["Round Ownership"].astype(float)
+    invested = result["Invested"].astype(float)
+    increase = result["Increase (round/round)"].astype(float)
+    dilution = result["Dilution (est)"].astype(float)
+    round_number = result["Round #"].astype(float)
+    is_adjustment = result["Round Name"] == 'Adjustment'
+
+    # Adjustment rows that carry their own Dilution (est) keep their values as entered
+    checked = ~(is_adjustment & dilution.notna() & (dilution != 0.0))
+
+    # Estimated rounds: fill Post Money from Total Invested / Round Ownership, or Total Invested from Post Money * Round Ownership
+    estimated = checked & (result["Estimated"] == 'Y') & (round_ownership > 0)
+    fill_post_money = estimated & (total_invested > 0)
+    fill_total_invested = estimated & ~fill_post_money & (post_money > 0)
+    post_money = post_money.mask(fill_post_money, total_invested / round_ownership)
+    total_invested = total_invested.mask(fill_total_invested, post_money * round_ownership)
+
+    # Check + Fix: Premoney + Total Invested == Post Money
+    fill_post_money = checked & premoney.notna() & total_invested.notna() & (post_money == 0)
+    fill_premoney = checked & ~fill_post_money & (premoney == 0) & total_invested.notna() & post_money.notna()
+    post_money = post_money.mask(fill_post_money, premoney + total_invested)
+    premoney = premoney.mask(fill_premoney, post_money - total_invested)
+
+    # Check: Round Ownership == Total Invested / Post Money and My Ownership == Invested / Post Money
+    has_post_money = checked & post_money.notna() & (post_money > 0)
+    round_ownership = round_ownership.mask(has_post_money & total_invested.notna(), total_invested / post_money)
+    my_ownership = result["My Ownership"].astype(float).mask(has_post_money & invested.notna(), invested / post_money)
+
+    # Work through each company in Round # order so the previous round is the row before
+    order, names, rounds = company_round_order(result)
+
+    # Check: Increase (round/round) = Post Money (this) / Post Money (previous), using the previous round's Post Money as loaded
+    previous_post_money = df["Post Money"].astype(float).iloc[order].reset_index(drop=True).groupby(names, sort=False, observed=True).shift()
+    previous_round = rounds.groupby(names, sort=False, observed=True).shift()
+    previous_post_money = previous_post_money.where(previous_round == rounds - 1)
+    post_money_sorted = post_money.iloc[order].reset_index(drop=True)
+    later_round = rounds >= 2
+    fill_increase = later_round & previous_post_money.notna() & post_money_sorted.notna() & (previous_post_money > 0)
+    increase_sorted = increase.iloc[order].reset_index(drop=True).mask(fill_increase, post_money_sorted / previous_post_money)
+
+    # Dilution (est) = Increase (round/round) * (1 - Round Ownership), except for Adjustment rows which take the entered
+    # Dilution (est) as the total and divide out the dilution of the previous rounds (excluding round 1)
+    round_ownership_sorted = round_ownership.iloc[order].reset_index(drop=True)
+    adjustment_sorted = is_adjustment.iloc[order].reset_index(drop=True)
+    fill_dilution = later_round & increase_sorted.notna() & round_ownership_sorted.notna()
+    dilution_sorted = dilution.iloc[order].reset_index(drop=True)
+    dilution_sorted = dilution_sorted.mask(fill_dilution & ~adjustment_sorted, increase_sorted * (1 - round_ownership_sorted))
+
+    # Each Adjustment depends on the ones before it, so resolve them in turn (companies rarely have more than a few)
+    fill_adjustment = fill_dilution & adjustment_sorted
+    adjustment_rank = adjustment_sorted.astype(int).groupby(names, sort=False, observed=True).cumsum().where(fill_adjustment, 0)
+    for rank in range(1, int(adjustment_rank.max()) + 1):
+        factors = dilution_sorted.where(rounds != 1).fillna(1.0)
+        previous_product = factors.groupby(names, sort=False, observed=True).cumprod().groupby(names, sort=False, observed=True).shift(fill_value=1.0)
+        dilution_sorted = dilution_sorted.mask(adjustment_rank == rank, dilution_sorted / previous_product)
+
+    # Back into the original row order
+    position = np.empty_like(order)
+    position[order] = np.arange(len(order))
+    result["Total Invested"] = total_invested
+    result["Premoney"] = premoney
+    result["Post Money"] = post_money
+    result["Round Ownership"] = round_ownership
+    result["My Ownership"] = my_ownership
+    result["Increase (round/round)"] = increase_sorted.to_numpy()[position]
+    result["Dilution (est)"] = dilution_sorted.to_numpy()[position]
+    return result
+
+def update_calculated_columns(original_df, report_changes=None):
+    """ Updates the calculated columns based on other data, such as round on round increases and dilution.
+    If given, report_changes is called with the original rows merged with their recalculated values (as '<col>_updated'
+    columns) before they are copied over.
+    """
+
+    df = original_df # Only read, the recalculation and the merge below make new frames
+
+    # # Remove total from the data frame so it doesn't get in the way - this probably doesn't exist any more
+    if 'Total' in df['Name'].values:
+        df = df[df['Name'] != 'Total']
+    log.debug("with values in Round Ownership %s", df['Round Ownership'])
+
+    # Recalculate every company at once, leaving rows without a name (e.g. just added in the editor) as they are
+    updated_df = recalculate_rounds(df[df['Name'].notna()])
+
+    # Now don't check if empty as they might all be empty
+    if updated_df.empty == False :
+        # Overwrite the old df values with the new ones.
+        # Do an inner join to ensure that the index are all set correctly
+        log.debug("Updated DF %s", updated_df)
+        if report_changes is None:
+            # Only the calculated columns are copied back, so only merge those when nobody looks at the others
+            updated_df = updated_df[['Name', 'Round #'] + CALCULATED_COLUMNS]
+        merged_df = pd.merge(original_df, updated_df, on=['Name', 'Round #'], how='left', suffixes=('', '_updated'))
+        if report_changes is not None:
+            report_changes(merged_df)
+
+        # Update the relevant columns from _updated columns
+        for col in CALCULATED_COLUMNS:
+            if f'{col}_updated' in merged_df.columns:
+                merged_df[col] = merged_df[f'{col}_updated'].combine_first(merged_df[col])
+
+        # Drop the extra columns - now everything is updated
+        merged_df.drop(columns=[col for col in merged_df.columns if col.endswith('_updated')], inplace=True)
+        # Assign the result back to df
+        result = merged_df 
+        log.debug("Updated DF was not empty result was: %s", result)
+
+    else :
+        result = df.copy()
+        log.debug("Updated DF was empty result was: %s", result)
+    
+    return result
+
+def change_log(merged_df):
+    """Lists the recalculated values that changed, from the original rows merged with their recalculated values
+    ('<col>_updated' columns), as one row per change: Name, Round #, Column, Old, New and Change % (empty when Old is 0 or missing)."""
+    changes = []
+    for position, col in enumerate(CALCULATED_COLUMNS):
+        if f'{col}_updated' not in merged_df.columns:
+            continue
+        old = merged_df[col].to_numpy(dtype=float)
+        new = merged_df[f'{col}_updated'].to_numpy(dtype=float)
+        changed = ~np.isnan(new) & (old != new)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            change_percent = np.where(old != 0, (new - old) / old * 100, np.nan)
+        rows = np.flatnonzero(changed)
+        changes.append(pd.DataFrame({
+            "Row": rows,
+            "Order": position,
+            "Name": merged_df["Name"].to_numpy()[rows],
+            "Round #": merged_df["Round #"].to_numpy()[rows],
+            "Column": col,
+            "Old": old[rows],
+            "New": new[rows],
+            "Change %": change_percent[rows],
+        }))
+    if not changes:
+        return pd.DataFrame(columns=CHANGE_LOG_COLUMNS)
+    # In row order, then in the order of the columns
+    return pd.concat(changes, ignore_index=True).sort_values(["Row", "Order"], ignore_index=True)[CHANGE_LOG_COLUMNS]
+
+def calculate_increase_value(original_df):
+    """Calculates the 'Increase (Value)' column based on dilution and invested amounts."""
+    # Shares every column except Increase (Value) with original_df, which is left as it is
+    df = original_df.copy(deep=False)
+    # Each investment is multiplied by the Dilution (est) of every later row for the same company (NaN counts as 1),
+    # which is a reverse cumulative product per company excluding the row itself
+    reversed_df = df[["Name", "Invested", "Dilution (est)"]].iloc[::-1]
+    reversed_names = reversed_df["Name"]
+    trailing_dilution = reversed_df["Dilution (est)"].astype(float).fillna(1.0).groupby(reversed_names, observed=True).cumprod()
+    dilution_multiplier = trailing_dilution.groupby(reversed_names, observed=True).shift(fill_value=1.0).iloc[::-1]
+    invested = df["Invested"].astype(float)
+    has_investment = (invested > 0) & df["Name"].notna()
+    df["Increase (Value)"] = np.where(has_investment, invested * dilution_multiplier.to_numpy(), 0.0)
+    return df
+
+def company_fingerprints(df):
+    """Returns a content hash of each company's rows (values and row order), indexed by Name."""
+    row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    # Mix in the position within the company so that reordering rounds also changes the fingerprint
+    positions = df.groupby("Name", sort=False, observed=True).cumcount().fillna(0).to_numpy().astype(np.uint64)
+    mixed = pd.util.hash_array(row_hashes ^ positions)
+    return pd.Series(mixed, index=df.index).groupby(df["Name"], sort=False, observed=True).sum()
+
+def company_rows(df):
+    """Returns the row positions of each company in df, as a dict of Name to an array of positions in row order."""
+    if df.empty:
+        return {}
+    return df.groupby("Name", sort=False, observed=True).indices
+
+def window_rows(rows_by_company, names):
+    """Returns the row positions of the companies in names (see company_rows), in row order."""
+    if not len(names):
+        return np.array([], dtype=np.intp)
+    return np.sort(np.concatenate([rows_by_company[name] for name in names]))
+
+def changed_companies(before, after):
+    """Returns the Names of the companies whose rows differ between before and after (see company_fingerprints),
+    including companies that are only in one of them."""
+    before_fingerprints = company_fingerprints(before)
+    after_fingerprints = company_fingerprints(after)
+    names = before_fingerprints.index.union(after_fingerprints.index, sort=False)
+    changed = before_fingerprints.reindex(names).ne(after_fingerprints.reindex(names))
+    return list(names[changed.to_numpy()])
+
+def merge_window(df, rows, edited):
+    """Puts edited, the rows of df at the positions rows after editing (with rows added or removed), back into df in
+    place of those rows, where the first of them was. Returns the merged table (df itself if nothing changed) and the
+    Names of the companies whose rows changed."""
+    window = df.iloc[rows]
+    if len(window) == len(edited) and np.array_equal(pd.util.hash_pandas_object(window, index=False).to_numpy(),
+                                                     pd.util.hash_pandas_object(edited, index=False).to_numpy()):
+        return df, []
+    if len(window) == len(edited) and list(edited.columns) == list(df.columns):
+        merged = write_rows(df, rows, edited)
+        if merged is not None:
+            return merged, changed_companies(window, edited)
+    keep = np.ones(len(df), dtype=bool)
+    keep[rows] = False
+    first = rows[0] if len(rows) else len(df)
+    merged = pd.concat([df.iloc[:first][keep[:first]], edited, df.iloc[first:][keep[first:]]], ignore_index=True)
+    return merged, changed_companies(window, edited)
+
+def write_rows(df, rows, edited):
+    """Returns df with the rows at the positions rows replaced by edited, copying only the columns that changed so the
+    others stay shared with df (e.g. mapped from a snapshot). None if a changed column can't hold the edited values,
+    such as a category that isn't in it yet."""
+    result = df.copy(deep=False)
+    for col in df.columns:
+        column, values = df[col], edited[col]
+        if column.iloc[rows].reset_index(drop=True).equals(values.reset_index(drop=True)):
+            continue
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            new_codes = column.cat.categories.get_indexer(values.astype(object))
+            if ((new_codes == -1) & values.notna().to_numpy()).any():
+                return None
+            codes = column.cat.codes.to_numpy(copy=True)
+            codes[rows] = new_codes
+            result[col] = pd.Categorical.from_codes(codes, dtype=column.dtype)
+        else:
+            data = column.to_numpy(copy=True)
+            try:
+                data[rows] = values.to_numpy()
+            except (TypeError, ValueError):
+                return None
+            result[col] = data
+    return result
+
+def recalculate_companies(df, names):
+    """Returns df with the calculated columns of the companies in names recalculated by process_data, and the other
+    rows as they are. Companies are recalculated independently, so this matches recalculating everything for them."""
+    rows = np.flatnonzero(df["Name"].isin(names).to_numpy())
+    if not len(rows):
+        return df
+    recalculated = process_data(df.iloc[rows])
+    result = df.copy(deep=False)
+    for col in CALCULATED_COLUMNS + ["Increase (Value)"]:
+        values = result[col].to_numpy(copy=True)
+        values[rows] = recalculated[col].to_numpy()
+        result[col] = values
+    return result
+
+def recalculated_values(df, result):
+    """Returns the rows of df with the calculated values of result, its recalculation in the same row order, as
+    '<col>_updated' columns, as update_calculated_columns passes them to report_changes."""
+    merged_df = df.copy(deep=False)
+    for col in CALCULATED_COLUMNS:
+        merged_df[f'{col}_updated'] = result[col].to_numpy()
+    return merged_df
+
+def recalculate_changed_companies(df, cache, report_changes=None):
+    """ Runs update_calculated_columns and calculate_increase_value only for the companies whose rows differ from the
+    last call with the same cache (a dict, updated in place) and splices them into the cached result.
+    A company is unchanged only if its rows match what was passed in last time: the recalculation isn't idempotent
+    (an Adjustment's Dilution (est) is divided again, Increase (round/round) follows a filled in Post Money), so rows
+    returned last time are recalculated again, as process_data would. report_changes is shown the changes of every
+    company, the unchanged ones from the cached result.
+    """
+    fingerprints = company_fingerprints(df)
+    cached_result = cache.get("result")
+
+    if cached_result is None or cache.get("columns") != list(df.columns):
+        unchanged_names = fingerprints.index[:0]
+    else:
+        unchanged_names = fingerprints.index[fingerprints == cache["input_fingerprints"].reindex(fingerprints.index)]
+    changed_rows = ~df["Name"].isin(unchanged_names).to_numpy()
+    kept = cached_result[cached_result["Name"].isin(unchanged_names)] if len(unchanged_names) else None
+
+    if not changed_rows.any():
+        result = cached_result
+    elif kept is None or len(kept) != (~changed_rows).sum():
+        result = calculate_increase_value(update_calculated_columns(df, report_changes))
+        # Rounds listed twice can give more rows than df, so the changes were shown as they were recalculated
+        report_changes = None
+    else:
+        recalculated = calculate_increase_value(update_calculated_columns(df[changed_rows]))
+        # Unchanged companies have the same rows in the same order as in the cached result, so line them up by Name
+        kept_positions = np.flatnonzero(~changed_rows)
+        kept_positions = kept_positions[np.argsort(df["Name"].to_numpy()[kept_positions], kind="stable")]
+        kept = kept.iloc[np.argsort(kept["Name"].to_numpy(), kind="stable")]
+        result = pd.concat([
+            kept.set_axis(kept_positions),
+            recalculated.set_axis(np.flatnonzero(changed_rows)),
+        ]).sort_index().reset_index(drop=True)
+
+    if report_changes is not None and len(result) == len(df):
+        report_changes(recalculated_values(df, result))
+    record_recalculation(cache, df, result, fingerprints)
+    return result
+
+def record_recalculation(cache, df, result, fingerprints=None):
+    """Records result as the recalculation of df in a recalculate_changed_companies cache, e.g. when it was read from a saved copy."""
+    cache["columns"] = list(df.columns)
+    cache["input_fingerprints"] = company_fingerprints(df) if fingerprints is None else fingerprints
+    cache["result_fingerprints"] = company_fingerprints(result)
+    cache["result"] = result
+
+def process_data(df, report_changes=None):
+    """Processes the data by updating calculated columns and increase values."""
+    df = update_calculated_columns(df, report_changes)
+    df = calculate_increase_value(df)
+    return df
+
+def company_batches(df, batches):
+    """Splits the row positions of df into up to batches arrays of whole companies, each with about the same number of
+    rows. Rows without a Name go in the last batch."""
+    codes = pd.factorize(df["Name"])[0]
+    rows_per_company = np.bincount(codes[codes >= 0])
+    # A company goes in the batch its first row would fall in if the rows were split evenly
+    first_row = np.cumsum(rows_per_company) - rows_per_company
+    company_batch = first_row * batches // max(len(df), 1)
+    row_batch = np.where(codes >= 0, company_batch[codes], batches - 1)
+    order = np.argsort(row_batch, kind="stable")
+    return [positions for positions in np.split(order, np.cumsum(np.bincount(row_batch, minlength=batches))[:-1]) if len(positions)]
+
+def process_data_parallel(df, workers=None, min_rows=PARALLEL_MIN_ROWS):
+    """Same result as process_data(df), with the companies split into batches recalculated on workers processes
+    (default: all cores). Runs in this process if there are fewer than min_rows rows, one worker, or rounds listed
+    twice for a company, which the recalculation doesn't keep in row order."""
+    workers = os.cpu_count() if workers is None else workers
+    if workers <= 1 or len(df) < min_rows or df.duplicated(["Name", "Round #"]).any():
+        return process_data(df)
+    batches = company_batches(df, workers)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(process_data, [df.iloc[positions] for positions in batches]))
+    # One concatenation, then back into the original row order
+    result = pd.concat(results, ignore_index=True)
+    return result.take(np.argsort(np.concatenate(batches))).reset_index(drop=True)
+
+def calculate_total_position(df):
+    """Calculates the total position for each company, sorted by Dilution Increase. First and last are taken in Round #
+    order, whatever the order of the rows."""
+    order, _, _ = company_round_order(df)
+    summary_df = df.iloc[order].groupby("Name", observed=True).agg(
+        Rounds=("Round #", "count"),
+        Total_Invested=("Invested", "sum"),
+        Total_Value=("Increase (Value)", "sum"),
+        First_Val=("Post Money", "first"),
+        Last_Val=("Post Money", "last"),
+        First_Date=("Date", "first"),
+        Last_Date=("Date", "last"),
+    ).reset_index()
+    # One row per company, so nothing is saved by keeping Name as a category
+    summary_df["Name"] = summary_df["Name"].astype(object)
+    summary_df["Round Increase"] = summary_df["Last_Val"] / summary_df["First_Val"]
+    summary_df["Dilution Increase"] = summary_df["Total_Value"] / summary_df["Total_Invested"]
+    return sort_total_position(summary_df)
+
+def sort_total_position(summary_df):
+    """Sorts total positions by Dilution Increase, then by Name, so the order doesn't depend on which companies were
+    recalculated last."""
+    return summary_df.sort_values(["Dilution Increase", "Name"], ascending=[False, True], kind="stable", ignore_index=True)
+
+def portfolio_totals(summary_df):
+    """Returns the number of Companies and the sums of PORTFOLIO_TOTAL_COLUMNS over total positions."""
+    with np.errstate(invalid="ignore"):  # Values of opposite infinite sign add up to NaN
+        sums = summary_df[PORTFOLIO_TOTAL_COLUMNS].sum()
+    return pd.concat([pd.Series({"Companies": len(summary_df)}), sums]).astype(float)
+
+def rows_of(df, names):
+    """Returns the rows of the companies in names, with Name as plain text so they don't carry every category of df."""
+    rows = df[df["Name"].isin(names).to_numpy()]
+    return rows.astype({"Name": object}) if isinstance(rows["Name"].dtype, pd.CategoricalDtype) else rows
+
+def update_total_position(cache, df, names=None, fingerprints=None):
+    """Keeps the total position of each company of df (see calculate_total_position) in cache (a dict, updated in
+    place) under 'summary', recalculating only the companies whose rows changed since the last call, and the portfolio
+    totals (see portfolio_totals) under 'totals' as running sums. Changed companies are found by their
+    company_fingerprints, which can be passed in if known, or are only looked for among names if given.
+    Returns the summary and the Names of the companies that were recalculated or removed."""
+    summary = cache.get("summary")
+    if summary is None:
+        fingerprints = company_fingerprints(df) if fingerprints is None else fingerprints
+        summary = calculate_total_position(df)
+        totals = portfolio_totals(summary)
+        touched = list(fingerprints.index)
+    else:
+        previous = cache["fingerprints"]
+        if fingerprints is None and names is not None:
+            candidates = company_fingerprints(rows_of(df, names))
+            checked = previous.index.isin(names)
+        else:
+            candidates = company_fingerprints(df) if fingerprints is None else fingerprints
+            checked = np.ones(len(previous), dtype=bool)
+        # Plain Names, as comparing categorical indexes compares all their categories
+        candidates = candidates.set_axis(candidates.index.astype(object))
+        changed = list(candidates.index[candidates.ne(previous.reindex(candidates.index)).to_numpy()])
+        removed = list(previous.index[checked & ~previous.index.isin(candidates.index)])
+        fingerprints = pd.concat([previous[~checked & ~previous.index.isin(candidates.index)], candidates])
+        touched = changed + removed
+        totals = cache["totals"]
+        if touched:
+            replaced = summary["Name"].isin(touched).to_numpy()
+            recalculated = calculate_total_position(rows_of(df, changed))
+            totals = totals - portfolio_totals(summary[replaced]) + portfolio_totals(recalculated)
+            summary = sort_total_position(pd.concat([summary[~replaced], recalculated], ignore_index=True))
+            if not np.isfinite(totals).all():
+                # A running sum can't recover from an infinite or missing value, so start it again
+                totals = portfolio_totals(summary)
+    cache.update(fingerprints=fingerprints.set_axis(fingerprints.index.astype(object)), summary=summary, totals=totals)
+    return summary, touched
@@ -0,0 +1,128 @@
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+# Writing the results (the recalculated round table, the totals per company, the changes of the last recalculation)
+# to CSV, Parquet and Excel files in one go, without any Streamlit. Values are written as they are held, numbers as
+# numbers and dates as dates, not as formatted on screen. Tables are written a chunk of rows at a time, so no output
+# file is built whole in memory.
+
+EXPORT_DIR = os.environ.get("ROUNDCALC_EXPORT_DIR", os.path.join(os.path.expanduser("~"), "Downloads", "roundcalc-export"))
+
+EXPORT_FORMATS = ["csv", "parquet", "xlsx"]
+
+# Rows converted and written at a time
+CHUNK_ROWS = 100_000
+
+# Rows of data that fit on an Excel sheet under the header, longer tables go on to more sheets
+XLSX_MAX_ROWS = 1_048_575
+
+
+def chunks(df, rows=CHUNK_ROWS):
+    """Yields df a slice of rows rows at a time."""
+    for start in range(0, len(df), rows):
+        yield df.iloc[start:start + rows]
+
+
+def arrow_chunks(df, rows=CHUNK_ROWS):
+    """Returns the Arrow schema of df and yields it as Arrow tables of rows rows. Text mixed with other values is
+    written as text."""
+    df = df.copy(deep=False)
+    for col in df.columns:
+        if df[col].dtype == object:
+            try:
+                pa.array(df[col], from_pandas=True)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    return schema, (pa.Table.from_pandas(chunk, schema=schema, preserve_index=False) for chunk in chunks(df, rows))
+
+
+def csv_schema(df, schema):
+    """Returns the schema the columns of df are written to CSV as: categories as their values, and dates as plain dates
+    when none of them has a time of day. Other dates are written in full, down to the fraction of a second of e.g. a
+    row added in the editor."""
+    fields = []
+    for field in schema:
+        kind = field.type
+        if pa.types.is_dictionary(kind):
+            kind = kind.value_type
+        elif pa.types.is_timestamp(kind) and kind.tz is None:
+            dates = df[field.name].dropna()
+            if (dates == dates.dt.normalize()).all():
+                kind = pa.date32()
+        fields.append(pa.field(field.name, kind))
+    return pa.schema(fields)
+
+
+def write_csv(df, path, rows=CHUNK_ROWS):
+    # Arrow's CSV writer is several times faster than DataFrame.to_csv, and writes missing values as empty cells and
+    # numbers at full precision the same way
+    schema, tables = arrow_chunks(df, rows)
+    out_schema = csv_schema(df, schema)
+    with pa_csv.CSVWriter(path, out_schema) as writer:
+        for table in tables:
+            writer.write_table(table.cast(out_schema))
+
+
+def write_parquet(df, path, rows=CHUNK_ROWS):
+    schema, tables = arrow_chunks(df, rows)
+    with pq.ParquetWriter(path, schema) as writer:
+        for table in tables:
+            writer.write_table(table)
+
+
+def excel_rows(df, rows=CHUNK_ROWS):
+    """Yields the rows of df as lists of values Excel can hold: missing and infinite numbers as empty cells, dates as
+    datetimes and categories as their values."""
+    for chunk in chunks(df, rows):
+        columns = []
+        for col in chunk.columns:
+            values = chunk[col]
+            if values.dtype.kind in "fc":
+                values = values.where(np.isfinite(values.to_numpy(dtype=float)))
+            columns.append(values.astype(object).where(values.notna(), None).tolist())
+        yield from zip(*columns)
+
+
+def write_xlsx(tables, path, rows=CHUNK_ROWS, max_rows=XLSX_MAX_ROWS):
+    """Writes each frame of the dict tables to a sheet of an Excel workbook named after it, continuing tables too long
+    for a sheet on sheets '<name> 2', '<name> 3' and so on. The workbook is written as the rows come."""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    for name, df in tables.items():
+        sheet, part, sheet_rows = None, 1, max_rows
+        for row in excel_rows(df, rows):
+            if sheet_rows == max_rows:
+                sheet = workbook.create_sheet(name if part == 1 else f"{name} {part}")
+                sheet.append(list(df.columns))
+                sheet_rows, part = 0, part + 1
+            sheet.append(row)
+            sheet_rows += 1
+        if sheet is None:
+            workbook.create_sheet(name).append(list(df.columns))
+    workbook.save(path)
+
+
+def export_tables(tables, folder=EXPORT_DIR, formats=EXPORT_FORMATS, rows=CHUNK_ROWS):
+    """Writes the frames of the dict tables (e.g. rounds, totals, changes) to folder in each of formats: a <name>.csv
+    and <name>.parquet file per table and one roundcalc.xlsx workbook with a sheet per table. Returns the paths
+    written."""
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for fmt in formats:
+        if fmt == "xlsx":
+            path = os.path.join(folder, "roundcalc.xlsx")
+            write_xlsx(tables, path, rows)
+            paths.append(path)
+            continue
+        write = {"csv": write_csv, "parquet": write_parquet}[fmt]
+        for name, df in tables.items():
+            path = os.path.join(folder, f"{name}.{fmt}")
+            write(df, path, rows)
+            paths.append(path)
+    return paths
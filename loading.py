@@ -0,0 +1,358 @@
+import os
+import re
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Reading Round.csv exports into the round table, without any Streamlit so it can be used from scripts and worker processes
+
+# Numeric columns, which may hold currency symbols, commas or percent signs in the export
+NUMERIC_COLUMNS = [
+    "Total Invested",
+    "Premoney",
+    "Post Money",
+    "Invested",
+    "Increase (Value)",
+    "Round Ownership",
+    "My Ownership",
+    "Increase (round/round)",
+    "Dilution (est)",
+]
+
+# Columns stored as percentages in the export and as fractions in the round table
+PERCENTAGE_COLUMNS = ["Round Ownership", "My Ownership"]
+
+TEXT_COLUMNS = ["Name", "Round Name", "Estimated", "Notes"]
+
+# Text and dates are read as plain strings so pandas doesn't try to infer their types, numbers are parsed by the reader
+# and only the ones with currency or percent formatting are converted afterwards
+READ_DTYPES = {col: str for col in TEXT_COLUMNS + ["Date"]}
+
+REQUIRED_COLUMNS = ["Name", "Round #", "Date"] + NUMERIC_COLUMNS
+
+# Date format of the export, dates in any other format are parsed individually
+DATE_FORMAT = "%Y-%m-%d"
+
+# Lines before the first row of data: the title and the header
+HEADER_LINES = 2
+
+# Characters removed from numbers before converting them
+NUMBER_FORMATTING = str.maketrans("", "", "$,% ")
+
+# Everything but digits, '.', sign and exponent, removed from numbers that still don't convert (e.g. other currencies
+# or a trailing 'x')
+NON_NUMBER_CHARACTERS = r"[^0-9.eE+-]"
+
+BAD_ROW_COLUMNS = ["Line", "Column", "Value", "Problem"]
+
+# Column added to rows merged from several files, naming the file each row came from
+SOURCE_COLUMN = "Source"
+
+# Text columns with few distinct values, stored as categories in the compact round table. Estimated only holds Y or N,
+# so as a category it takes one byte per row like a boolean while still showing and exporting as Y/N.
+CATEGORY_COLUMNS = ["Name", "Round Name", "Estimated", SOURCE_COLUMN]
+
+# Ratios that are only shown, never read back by the recalculation, and can be kept as float32 in the compact round table.
+# Increase (round/round) isn't one: a round without a previous Post Money keeps it and works out Dilution (est) from it
+DISPLAY_RATIO_COLUMNS = ["My Ownership"]
+
+
+def clean_numbers(raw):
+    """Converts the columns of raw (as read from the export) to floats, removing currency, percent and other formatting
+    from the columns the reader left as text in one pass over all of them. Returns the converted frame and a boolean frame
+    marking the values that could not be converted."""
+    text_columns = [col for col in raw.columns if not pd.api.types.is_numeric_dtype(raw[col])]
+    converted = raw.astype({col: float for col in raw.columns if col not in text_columns})
+    bad = pd.DataFrame(False, index=raw.index, columns=raw.columns)
+    if text_columns:
+        values = raw[text_columns].to_numpy(dtype=object).ravel(order="F")
+        present = pd.notna(values)
+        cleaned = pd.Series(values[present]).str.translate(NUMBER_FORMATTING)
+        numbers = np.full(len(values), np.nan)
+        try:
+            numbers[present] = cleaned.astype(float).to_numpy()
+        except ValueError:
+            # Some values have other formatting or aren't numbers at all, find them the slower way
+            cleaned = cleaned.str.replace(NON_NUMBER_CHARACTERS, "", regex=True)
+            numbers[present] = pd.to_numeric(cleaned, errors="coerce").to_numpy(dtype=float)
+        shape = (len(raw), len(text_columns))
+        converted[text_columns] = numbers.reshape(shape, order="F")
+        bad[text_columns] = (present & np.isnan(numbers)).reshape(shape, order="F")
+    return converted.fillna(0), bad  # Set values to 0 if they are not a number
+
+
+def parse_dates(raw, date_format=DATE_FORMAT):
+    """Converts a Series of date strings, using date_format where possible and parsing the rest one by one.
+    Returns the dates and a boolean Series marking the dates that could not be parsed."""
+    if pd.api.types.is_datetime64_any_dtype(raw):
+        return raw, pd.Series(False, index=raw.index)
+    dates = pd.to_datetime(raw, format=date_format, errors="coerce")
+    retry = raw.notna() & dates.isna()
+    if retry.any():
+        dates[retry] = pd.to_datetime(raw[retry], format="mixed", errors="coerce")
+    return dates, raw.notna() & dates.isna()
+
+
+def bad_rows_report(raw, bad, problem, lines):
+    """Lists the values of raw marked in bad as (Line, Column, Value, Problem) rows. lines holds the line number of each row."""
+    rows, cols = np.nonzero(bad.to_numpy())
+    return pd.DataFrame({
+        "Line": lines[rows],
+        "Column": bad.columns[cols],
+        "Value": raw.to_numpy(dtype=object)[rows, cols] if len(rows) else [],
+        "Problem": problem,
+    }, columns=BAD_ROW_COLUMNS)
+
+
+def skipped_lines_report(caught_warnings):
+    """Lists the lines pandas skipped for having the wrong number of fields, from the warnings it raised."""
+    rows = []
+    for warning in caught_warnings:
+        if issubclass(warning.category, pd.errors.ParserWarning):
+            for message in str(warning.message).strip().splitlines():
+                line = re.search(r"line (\d+)", message)
+                rows.append((int(line.group(1)) if line else np.nan, None, message, "wrong number of fields, row skipped"))
+    return pd.DataFrame(rows, columns=BAD_ROW_COLUMNS)
+
+
+def skipped_rows_report(source, invalid_rows):
+    """Lists the rows pyarrow skipped for having the wrong number of fields, from the rows given to its invalid_row_handler.
+    pyarrow doesn't number them when reading in parallel, so they are looked up by their text in source (a path or a
+    file that can be read again). Rows that can't be found have no Line."""
+    texts = [row.text for row in invalid_rows]
+    lines = find_lines(source, texts)
+    rows = [(line, None, f"Expected {row.expected_columns} fields, saw {row.actual_columns}: {row.text}", "wrong number of fields, row skipped")
+            for line, row in zip(lines, invalid_rows)]
+    return pd.DataFrame(rows, columns=BAD_ROW_COLUMNS)
+
+
+def find_lines(source, texts):
+    """Returns the line number in source (a path or seekable file) of each of texts, after the header. A text listed twice
+    is found at two lines. NaN for texts that aren't found or if source can't be read again."""
+    lines = np.full(len(texts), np.nan)
+    if not texts:
+        return lines
+    wanted = {}
+    for position, text in enumerate(texts):
+        wanted.setdefault(text, []).append(position)
+    if isinstance(source, (str, os.PathLike)):
+        f = open(source, "rb")
+    elif hasattr(source, "seek") and source.seekable():
+        source.seek(0)
+        f = source
+    else:
+        return lines
+    try:
+        for number, line in enumerate(f, start=1):
+            text = (line.decode("utf-8", errors="replace") if isinstance(line, bytes) else line).rstrip("\r\n")
+            if number > HEADER_LINES and wanted.get(text):
+                lines[wanted[text].pop(0)] = number
+                if not any(wanted.values()):
+                    break
+    finally:
+        if f is not source:
+            f.close()
+    return lines
+
+
+def convert_round_table(raw, lines=None, date_format=DATE_FORMAT):
+    """Converts the types of rows read with READ_DTYPES, in place. lines holds the line number of each row in the file.
+    Returns the round table and a report of the values that could not be converted."""
+    missing = [col for col in REQUIRED_COLUMNS if col not in raw.columns]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+    if lines is None:
+        lines = np.arange(len(raw)) + HEADER_LINES + 1
+    df = raw
+    reports = [bad_rows_report(raw[["Name"]], raw[["Name"]].isna(), "missing", lines)]
+
+    numbers, bad = clean_numbers(raw[NUMERIC_COLUMNS])
+    reports.append(bad_rows_report(raw[NUMERIC_COLUMNS], bad, "not a number", lines))
+    df[NUMERIC_COLUMNS] = numbers
+    # divide percentage column values by 100
+    df[PERCENTAGE_COLUMNS] = df[PERCENTAGE_COLUMNS] / 100
+
+    round_number = pd.to_numeric(raw["Round #"], errors="coerce")
+    bad_round = round_number.isna() | (round_number % 1 != 0)
+    reports.append(bad_rows_report(raw[["Round #"]], bad_round.to_frame("Round #"), "missing or not a whole number", lines))
+    df["Round #"] = round_number.where(~bad_round).astype("Int64" if bad_round.any() else "int64")
+
+    dates, bad_date = parse_dates(raw["Date"], date_format)
+    reports.append(bad_rows_report(raw[["Date"]], bad_date.to_frame("Date"), "not a date", lines))
+    df["Date"] = dates
+
+    bad_rows = pd.concat(reports, ignore_index=True).sort_values("Line", kind="stable", ignore_index=True)
+    return df, bad_rows
+
+
+def row_lines(first_line, count, skipped):
+    """Returns the line numbers of count rows read from first_line onwards, given the line numbers pandas skipped.
+    If a skipped line isn't known (NaN), the rows after it can't be numbered, and as it isn't known which those are,
+    no row is (all NaN)."""
+    skipped = np.asarray(skipped, dtype=float)
+    if np.isnan(skipped).any():
+        return np.full(count, np.nan)
+    candidates = np.arange(first_line, first_line + count + len(skipped))
+    return np.setdiff1d(candidates, skipped.astype(candidates.dtype))[:count]
+
+
+def read_round_csv(source, engine=None, date_format=DATE_FORMAT, chunksize=None):
+    """Loads a Round.csv export (a path or file-like object, title on the first line) and converts the column types.
+    engine is passed to pandas.read_csv ('pyarrow' is usually fastest if installed). With chunksize the file is
+    converted that many rows at a time, which keeps the memory for the raw text down, but the whole round table is
+    still returned in memory. Files larger than memory are converted with convert_round_csv (batch.py --convert).
+    Returns the round table and a report of the rows that were skipped or had values that could not be converted
+    (they are set to 0 or left empty). Raises if the file can't be read or is missing columns."""
+    if chunksize is not None:
+        chunks = list(iter_round_csv(source, chunksize, date_format=date_format))
+        if not chunks:
+            return pd.DataFrame(columns=REQUIRED_COLUMNS), pd.DataFrame(columns=BAD_ROW_COLUMNS)
+        return pd.concat([df for df, _ in chunks], ignore_index=True), pd.concat([report for _, report in chunks], ignore_index=True)
+    if engine == "pyarrow":
+        # pyarrow reads everything (including dates) faster by itself, and turns missing text into 'None' when given str.
+        # Its warnings for skipped rows don't say where they were, so the rows are kept to look them up
+        invalid_rows = []
+        raw = pd.read_csv(source, header=1, engine=engine, on_bad_lines=lambda row: invalid_rows.append(row) or "skip")
+        # Text as plain strings with NaN when missing, the same as the default reader
+        for col in [col for col in TEXT_COLUMNS if col in raw.columns]:
+            raw[col] = raw[col].astype(object).where(raw[col].notna(), np.nan)
+        skipped = skipped_rows_report(source, invalid_rows)
+    else:
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always", pd.errors.ParserWarning)
+            raw = pd.read_csv(source, header=1, dtype=READ_DTYPES, engine=engine, on_bad_lines="warn")
+        skipped = skipped_lines_report(caught)
+    df, bad_rows = convert_round_table(raw, row_lines(HEADER_LINES + 1, len(raw), skipped["Line"]), date_format)
+    return df, pd.concat([skipped, bad_rows], ignore_index=True).sort_values("Line", kind="stable", ignore_index=True)
+
+
+def iter_round_csv(source, chunksize=100_000, date_format=DATE_FORMAT):
+    """Reads and converts a Round.csv export chunksize rows at a time, yielding (round table, bad rows report) per chunk."""
+    first_line = HEADER_LINES + 1
+    with pd.read_csv(source, header=1, dtype=READ_DTYPES, chunksize=chunksize, on_bad_lines="warn") as reader:
+        while True:
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter("always", pd.errors.ParserWarning)
+                raw = next(reader, None)
+            if raw is None:
+                break
+            skipped = skipped_lines_report(caught)
+            lines = row_lines(first_line, len(raw), skipped["Line"].dropna())
+            df, bad_rows = convert_round_table(raw, lines, date_format)
+            yield df, pd.concat([skipped, bad_rows], ignore_index=True).sort_values("Line", kind="stable", ignore_index=True)
+            first_line = (lines[-1] if len(lines) else first_line) + 1
+
+
+def convert_round_csv(source, destination, chunksize=100_000, date_format=DATE_FORMAT):
+    """Converts a Round.csv export to a Parquet file chunk by chunk, so files larger than memory can be checked and
+    converted. Needs pyarrow. Returns the report of the values that could not be converted."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # The same column types in every chunk, even if a chunk has no values in a column
+    known_types = {col: pa.string() for col in TEXT_COLUMNS}
+    known_types.update({col: pa.float64() for col in NUMERIC_COLUMNS})
+    known_types.update({"Round #": pa.int64(), "Date": pa.timestamp("ns")})
+
+    writer = None
+    reports = []
+    try:
+        for df, bad_rows in iter_round_csv(source, chunksize, date_format):
+            if writer is None:
+                inferred = pa.Schema.from_pandas(df, preserve_index=False)
+                schema = pa.schema([pa.field(col, known_types.get(col, inferred.field(col).type)) for col in df.columns])
+                writer = pq.ParquetWriter(destination, schema)
+            writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+            reports.append(bad_rows)
+    finally:
+        if writer is not None:
+            writer.close()
+    return pd.concat(reports, ignore_index=True) if reports else pd.DataFrame(columns=BAD_ROW_COLUMNS)
+
+
+def round_csv_paths(source):
+    """Returns the .csv files in the folder source (and its subfolders) in path order, or source itself if it's a file."""
+    if not os.path.isdir(source):
+        return [source]
+    paths = []
+    for folder, subfolders, files in os.walk(source):
+        subfolders.sort()
+        paths.extend(os.path.join(folder, name) for name in sorted(files) if name.lower().endswith(".csv"))
+    return sorted(paths)
+
+
+def source_labels(sources):
+    """Returns a short label for each source, a path or an uploaded file: the path within the folder the paths have in
+    common, so Fund1/Round.csv and Fund2/Round.csv stay apart, or the name of the uploaded file."""
+    paths = [os.path.abspath(source) for source in sources if isinstance(source, (str, os.PathLike))]
+    common = os.path.commonpath([os.path.dirname(path) for path in paths]) if paths else ""
+    return [
+        os.path.relpath(os.path.abspath(source), common) if isinstance(source, (str, os.PathLike))
+        else getattr(source, "name", f"file {i + 1}")
+        for i, source in enumerate(sources)
+    ]
+
+
+def merge_round_tables(tables, labels, precedence="last"):
+    """Concatenates round tables from several files, tagging each row with its label in SOURCE_COLUMN, and drops rows
+    whose (Name, Round #) is also in a file of higher precedence: "last" (later files win), "first" (earlier files win)
+    or a list of labels, highest first (files not listed come after them, later ones first). Rows listed twice within
+    one file are all kept, for round_problems to report. Returns the merged table and the rows that were dropped."""
+    if precedence == "last":
+        ranks = range(len(tables))
+    elif precedence == "first":
+        ranks = range(len(tables), 0, -1)
+    else:
+        order = list(precedence)
+        ranks = [len(tables) + len(order) - order.index(label) if label in order else i for i, label in enumerate(labels)]
+    merged = pd.concat(tables, ignore_index=True)
+    merged[SOURCE_COLUMN] = pd.Categorical(np.repeat(labels, [len(table) for table in tables]), categories=list(dict.fromkeys(labels)))
+    rank = pd.Series(np.repeat(list(ranks), [len(table) for table in tables]), index=merged.index)
+    best = rank.groupby([merged["Name"], merged["Round #"]], observed=True).transform("max")
+    # Rows without a Name or Round # can't overlap, they have no best rank
+    kept = (rank >= best) | best.isna()
+    return merged[kept.to_numpy()].reset_index(drop=True), merged[~kept.to_numpy()].reset_index(drop=True)
+
+
+def read_round_csvs(sources, engine=None, precedence="last", workers=None, read=None):
+    """Loads several Round.csv exports, or every .csv file in a folder, reading them concurrently on workers threads
+    (the readers spend most of their time outside the GIL) and merges them with merge_round_tables. read(source) can
+    replace read_round_csv(source, engine), e.g. to read through a cache. Returns the merged round table, the report of
+    the values that could not be read (with the SOURCE_COLUMN of each) and the rows dropped as overlapping."""
+    if isinstance(sources, (str, os.PathLike)):
+        sources = round_csv_paths(sources)
+    sources = list(sources)
+    if not sources:
+        raise ValueError("No Round.csv files to load")
+    read = read or (lambda source: read_round_csv(source, engine))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(read, sources))
+    labels = source_labels(sources)
+    df, dropped = merge_round_tables([table for table, _ in results], labels, precedence)
+    reports = [report.assign(**{SOURCE_COLUMN: label}) for (_, report), label in zip(results, labels)]
+    bad_rows = pd.concat(reports, ignore_index=True)[[SOURCE_COLUMN] + BAD_ROW_COLUMNS]
+    return df, bad_rows, dropped
+
+
+def compact_round_table(df, float32_ratios=False):
+    """Returns df with CATEGORY_COLUMNS as categories and, with float32_ratios, DISPLAY_RATIO_COLUMNS as float32, which
+    takes a fraction of the memory of Python strings and float64. Values are unchanged apart from the float32 rounding."""
+    dtypes = {col: "category" for col in CATEGORY_COLUMNS if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype)}
+    if float32_ratios:
+        dtypes.update({col: np.float32 for col in DISPLAY_RATIO_COLUMNS if col in df.columns})
+    return df.astype(dtypes) if dtypes else df
+
+
+def expand_round_table(df):
+    """Returns df with the compact columns back as plain text and float64, e.g. for editing, where new values can't be
+    added to a category."""
+    dtypes = {col: object for col in CATEGORY_COLUMNS if col in df.columns and isinstance(df[col].dtype, pd.CategoricalDtype)}
+    dtypes.update({col: float for col in DISPLAY_RATIO_COLUMNS if col in df.columns and df[col].dtype == np.float32})
+    return df.astype(dtypes) if dtypes else df
+
+
+def memory_bytes(df):
+    """Returns the memory used by df, including the strings it holds."""
+    return int(df.memory_usage(deep=True).sum())
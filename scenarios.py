@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+
+# Projects the portfolio forward with the same model the recalculation uses: each new round steps the valuation up by
+# Increase (round/round) and sells Round Ownership of the company, so it multiplies the value of the position by its
+# Dilution (est) = Increase (round/round) * (1 - Round Ownership) and our ownership by (1 - Round Ownership).
+# Thousands of futures are drawn for every company at once as NumPy arrays.
+
+PERCENTILES = [5, 25, 50, 75, 95]
+
+# Round sizes drawn at a time, which bounds the memory of a simulation to about 32 MB more than its results
+DRAW_CHUNK_VALUES = 1 << 22
+
+
+def current_positions(df):
+    """Returns the position in each company of a recalculated round table, by Name: Invested, Value (the sum of
+    Increase (Value), NaN if it isn't finite) and Ownership (the My Ownership of each round diluted by the Round
+    Ownership sold in the rounds after it)."""
+    named = df[df["Name"].notna()]
+    # Ownership bought in a round is diluted by every later round of the company
+    reversed_df = named[["Name", "Round Ownership"]].iloc[::-1]
+    kept = (1 - reversed_df["Round Ownership"].astype(float).fillna(0.0)).groupby(reversed_df["Name"], observed=True).cumprod()
+    later_dilution = kept.groupby(reversed_df["Name"], observed=True).shift(fill_value=1.0).iloc[::-1]
+    ownership = named["My Ownership"].astype(float).fillna(0.0) * later_dilution
+    positions = pd.DataFrame({
+        "Invested": named["Invested"].astype(float),
+        "Value": named["Increase (Value)"].astype(float),
+        "Ownership": ownership,
+    }).groupby(named["Name"].astype(object), sort=False).sum()
+    positions.index.name = "Name"
+    # Values that couldn't be calculated (e.g. after a Post Money of 0) can't be projected
+    positions["Value"] = positions["Value"].where(np.isfinite(positions["Value"]))
+    return positions
+
+
+def random_draws(simulations, companies, rounds, seed=0):
+    """Returns the random numbers simulate needs for simulations futures of rounds more rounds of companies companies.
+    They don't depend on the other parameters of the scenario, so they can be drawn once and reused while those change,
+    which also makes the results move smoothly with the parameters. The round sizes, one per round, would take rounds
+    times the memory of the rest, so only the seed they are drawn from is kept (see log_kept_shares)."""
+    rng = np.random.default_rng(seed)
+    return {
+        # The step-ups of all the rounds multiply, so only the sum of their standard normals is needed
+        "step_up": rng.standard_normal((simulations, companies)) * np.sqrt(rounds),
+        "round_size_seed": seed,
+        # A company survives every round with probability (1 - failure_rate) ** rounds
+        "survival": rng.random((simulations, companies)),
+    }
+
+
+def log_kept_shares(simulations, companies, rounds, round_size_low, round_size_high, seed=0, chunk_values=DRAW_CHUNK_VALUES):
+    """Returns the log of the share of each company kept through rounds rounds that each sell a uniform share between
+    round_size_low and round_size_high, as a (simulations, companies) array. The round sizes are drawn about
+    chunk_values at a time and summed over the rounds straight away, so they are never all held at once. The same seed
+    draws the same round sizes whatever the share sold."""
+    log_kept = np.empty((simulations, companies))
+    step = max(1, chunk_values // max(companies * rounds, 1))
+    for chunk, start in enumerate(range(0, simulations, step)):
+        stop = min(start + step, simulations)
+        round_size = np.random.default_rng([seed, chunk]).random((stop - start, companies, rounds))
+        # log(1 - (low + (high - low) * u)), in place
+        round_size *= round_size_low - round_size_high
+        round_size += 1 - round_size_low
+        np.log(round_size, out=round_size)
+        round_size.sum(axis=2, out=log_kept[start:stop])
+    return log_kept
+
+
+def simulate(positions, rounds=3, step_up_median=2.0, step_up_spread=0.5, round_size_low=0.1, round_size_high=0.25,
+             failure_rate=0.0, simulations=2000, seed=0, draws=None):
+    """Draws simulations futures of rounds more rounds for every company in positions (see current_positions).
+    Each round steps up by a lognormal factor (median step_up_median, log standard deviation step_up_spread), sells a
+    uniform share of the company between round_size_low and round_size_high, and the company fails (its value goes
+    to 0) with probability failure_rate. draws can be given from random_draws(simulations, len(positions), rounds, seed).
+    Returns the value and the ownership of each company in each future, as (simulations, companies) arrays."""
+    if draws is None:
+        draws = random_draws(simulations, len(positions), rounds, seed)
+    simulations, companies = draws["step_up"].shape
+    log_kept = log_kept_shares(simulations, companies, rounds, round_size_low, round_size_high, draws["round_size_seed"])
+    survived = draws["survival"] < (1 - failure_rate) ** rounds
+
+    # In place, as these are the size of the results
+    values = step_up_spread * draws["step_up"]
+    values += rounds * np.log(step_up_median)
+    values += log_kept
+    np.exp(values, out=values)
+    values *= positions["Value"].to_numpy()
+    values *= survived
+    ownership = np.exp(log_kept, out=log_kept)
+    ownership *= positions["Ownership"].to_numpy()
+    return values, ownership
+
+
+def percentiles_of(samples, percentiles):
+    """np.percentile(samples, percentiles, axis=0) (linear interpolation) with one sort for all the percentiles."""
+    ordered = np.sort(samples, axis=0)
+    position = np.asarray(percentiles) / 100 * (len(ordered) - 1)
+    lower = np.floor(position).astype(int)
+    upper = np.minimum(lower + 1, len(ordered) - 1)
+    fraction = (position - lower).reshape((-1,) + (1,) * (ordered.ndim - 1))
+    return ordered[lower] + fraction * (ordered[upper] - ordered[lower])
+
+
+def percentile_bands(positions, values, ownership, percentiles=PERCENTILES):
+    """Summarises simulated futures (see simulate) as percentiles of the value and ownership of each company, and of
+    the value of the whole portfolio in a last 'Total' row. Companies whose value can't be calculated are left out of
+    the total."""
+    value_bands = percentiles_of(values, percentiles).T
+    ownership_bands = percentiles_of(ownership, percentiles).T
+    total_bands = percentiles_of(np.nansum(values, axis=1), percentiles)
+    bands = pd.DataFrame({
+        "Name": list(positions.index) + ["Total"],
+        "Invested": np.append(positions["Invested"].to_numpy(), positions["Invested"].sum()),
+        "Value": np.append(positions["Value"].to_numpy(), positions["Value"].sum()),
+        "Ownership": np.append(positions["Ownership"].to_numpy(), np.nan),
+    })
+    for i, percentile in enumerate(percentiles):
+        bands[f"Value P{percentile}"] = np.append(value_bands[:, i], total_bands[i])
+    for i, percentile in enumerate(percentiles):
+        bands[f"Ownership P{percentile}"] = np.append(ownership_bands[:, i], np.nan)
+    return bands
+
+
+def project_portfolio(df, percentiles=PERCENTILES, **scenario):
+    """Returns the percentile bands (see percentile_bands) of a recalculated round table after simulate(**scenario)."""
+    positions = current_positions(df)
+    values, ownership = simulate(positions, **scenario)
+    return percentile_bands(positions, values, ownership, percentiles)
@@ -0,0 +1,122 @@
+import os
+import shutil
+import tempfile
+
+import pyarrow as pa
+
+from cache import CACHE_DIR
+
+# Shared read-only snapshots of a recalculated portfolio, so sessions on one server that load the same file don't each
+# parse, recalculate and hold their own copy. A snapshot is written once as Arrow IPC files and memory-mapped by every
+# session: its numbers and dates are not copied but read from the file through the page cache, which the sessions
+# share. Frames read from a snapshot are read-only; edits make new frames that copy only the columns they change.
+# Each recalculation written for a file is a new version of its snapshot, which sessions can pick up.
+
+SNAPSHOT_DIR = os.environ.get("ROUNDCALC_SNAPSHOT_DIR", os.path.join(CACHE_DIR, "snapshots"))
+
+# Versions kept of each file's snapshot. Older ones are deleted, sessions that still map them keep reading them until
+# they pick up a newer one, as a mapped file stays readable after it's deleted
+KEEP_VERSIONS = 2
+
+
+def to_arrow(df):
+    """Converts df to an Arrow table whose numbers and dates can be mapped back without copying: NaN and NaT are kept as
+    values rather than turned into nulls, which would have to be filled in again on every read."""
+    columns = {}
+    for col in df.columns:
+        series = df[col]
+        if series.dtype.kind in "biufmM":
+            columns[col] = pa.array(series.to_numpy(), from_pandas=False)
+        else:
+            try:
+                columns[col] = pa.array(series, from_pandas=True)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                # Text mixed with other values, e.g. the values of a bad rows report, is kept as text
+                columns[col] = pa.array(series.where(series.isna(), series.astype(str)), from_pandas=True)
+    return pa.table(columns)
+
+
+def write_table(path, df):
+    table = to_arrow(df)
+    with pa.OSFile(path, "wb") as f, pa.ipc.new_file(f, table.schema) as writer:
+        writer.write_table(table)
+
+
+def map_table(path):
+    """Returns the frame written with write_table at path, memory-mapped: its numeric columns are read-only views of
+    the file."""
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).read_all().to_pandas(split_blocks=True)
+
+
+def snapshot_versions(key, snapshot_dir=SNAPSHOT_DIR):
+    """Returns the versions of the snapshot of the file with cache key key, oldest first."""
+    try:
+        names = os.listdir(os.path.join(snapshot_dir, key))
+    except OSError:
+        return []
+    return sorted(int(name) for name in names if name.isdigit())
+
+
+def latest_snapshot(key, snapshot_dir=SNAPSHOT_DIR):
+    """Returns the newest version of the snapshot of the file with cache key key, or None if there isn't one."""
+    versions = snapshot_versions(key, snapshot_dir)
+    return versions[-1] if versions else None
+
+
+def write_snapshot(key, tables, snapshot_dir=SNAPSHOT_DIR):
+    """Writes a new version of the snapshot of the file with cache key key, with the frames of the dict tables by name
+    (None ones are left out). A frame given under two names is written once and linked. Returns the version written.
+    The version is written to a temporary folder and moved into place, so sessions never see part of it."""
+    folder = os.path.join(snapshot_dir, key)
+    os.makedirs(folder, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=folder, suffix=".tmp")
+    try:
+        written = {}
+        for name, df in tables.items():
+            if df is None:
+                continue
+            path = os.path.join(tmp, f"{name}.arrow")
+            if id(df) in written:
+                os.link(written[id(df)], path)
+            else:
+                write_table(path, df)
+                written[id(df)] = path
+        while True:
+            version = (latest_snapshot(key, snapshot_dir) or 0) + 1
+            try:
+                os.rename(tmp, os.path.join(folder, str(version)))
+                break
+            except OSError:
+                # Another session wrote this version first
+                if not os.path.exists(os.path.join(folder, str(version))):
+                    raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    for old in snapshot_versions(key, snapshot_dir)[:-KEEP_VERSIONS]:
+        shutil.rmtree(os.path.join(folder, str(old)), ignore_errors=True)
+    return version
+
+
+def read_snapshot(key, version=None, snapshot_dir=SNAPSHOT_DIR):
+    """Maps a version of the snapshot of the file with cache key key (default: the newest). Returns a dict with the
+    version and the frames written by name (a frame written once under two names is mapped once), or None if the
+    snapshot isn't there."""
+    if version is None:
+        version = latest_snapshot(key, snapshot_dir)
+        if version is None:
+            return None
+    folder = os.path.join(snapshot_dir, key, str(version))
+    snapshot = {"version": version}
+    mapped = {}
+    try:
+        for entry in sorted(os.scandir(folder), key=lambda entry: entry.name):
+            if entry.name.endswith(".arrow"):
+                inode = entry.inode()
+                if inode not in mapped:
+                    mapped[inode] = map_table(entry.path)
+                snapshot[entry.name[:-len(".arrow")]] = mapped[inode]
+    except (OSError, pa.ArrowInvalid):
+        # Deleted as older than KEEP_VERSIONS since the version was listed
+        return None
+    return snapshot
@@ -0,0 +1,263 @@
+import hashlib
+import os
+import sqlite3
+from contextlib import closing, contextmanager
+
+import numpy as np
+import pandas as pd
+
+from loading import NUMERIC_COLUMNS, SOURCE_COLUMN
+
+# Local SQLite stores of portfolios, one row per (Name, Round #), so edits outlive the session and a company or the
+# totals can be read on their own. Only the rounds that changed are written, as upserts keyed on (Name, Round #). Rows without a
+# Name or Round # aren't stored until they have both, and of rounds listed twice the last one is kept. Each portfolio
+# (a file, a folder of files or an uploaded file) has a store of its own, so loading another one keeps its edits.
+
+STORE_DIR = os.environ.get("ROUNDCALC_STORE_DIR", os.path.join(os.path.expanduser("~"), ".local", "share", "roundcalc"))
+
+# Change when the tables change, so a store written by an older version is started again
+STORE_VERSION = 2
+
+ROUND_COLUMNS = [
+    "Name", "Round #", "Round Name", "Date", "Total Invested", "Estimated", "Premoney", "Post Money",
+    "Round Ownership", "Invested", "My Ownership", "Increase (round/round)", "Dilution (est)", "Increase (Value)", "Notes",
+    SOURCE_COLUMN,
+]
+
+KEY_COLUMNS = ["Name", "Round #"]
+
+TOTALS_COLUMNS = [
+    "Name", "Rounds", "Total_Invested", "Total_Value", "First_Val", "Last_Val", "First_Date", "Last_Date",
+    "Round Increase", "Dilution Increase",
+]
+
+INTEGER_COLUMNS = ["Round #", "Rounds"]
+REAL_COLUMNS = NUMERIC_COLUMNS + ["Total_Invested", "Total_Value", "First_Val", "Last_Val", "Round Increase", "Dilution Increase"]
+
+# Dates are stored as ISO 8601 text, to the second
+DATE_COLUMNS = ["Date", "First_Date", "Last_Date"]
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+def column_type(col):
+    return "INTEGER" if col in INTEGER_COLUMNS else "REAL" if col in REAL_COLUMNS else "TEXT"
+
+
+def quoted(columns):
+    return ", ".join(f'"{col}"' for col in columns)
+
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS rounds ({", ".join(f'"{col}" {column_type(col)}' for col in ROUND_COLUMNS)},
+                                   PRIMARY KEY ("Name", "Round #"));
+CREATE TABLE IF NOT EXISTS totals ({", ".join(f'"{col}" {column_type(col)}' for col in TOTALS_COLUMNS)},
+                                   PRIMARY KEY ("Name"));
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+UPSERT_ROUNDS = (
+    f"INSERT INTO rounds ({quoted(ROUND_COLUMNS)}) VALUES ({', '.join('?' * len(ROUND_COLUMNS))}) "
+    f'ON CONFLICT ("Name", "Round #") DO UPDATE SET '
+    + ", ".join(f'"{col}" = excluded."{col}"' for col in ROUND_COLUMNS if col not in KEY_COLUMNS)
+)
+
+
+def store_path(portfolio, store_dir=STORE_DIR):
+    """Returns the path of the store of the portfolio named portfolio, e.g. the path of its file."""
+    return os.path.join(store_dir, f"portfolio-{hashlib.sha256(portfolio.encode()).hexdigest()[:16]}.sqlite")
+
+
+@contextmanager
+def connect(path):
+    """Opens the store at path, creating it if needed, and commits what was written when the block ends without error."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with closing(sqlite3.connect(path)) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")  # Sessions can read while another one writes
+        if conn.execute("PRAGMA user_version").fetchone()[0] != STORE_VERSION:
+            conn.executescript(f"DROP TABLE IF EXISTS rounds; DROP TABLE IF EXISTS totals; DROP TABLE IF EXISTS meta;"
+                               f"PRAGMA user_version = {STORE_VERSION};")
+        conn.executescript(SCHEMA)
+        with conn:
+            yield conn
+
+
+def to_records(df, columns):
+    """Returns the rows of df as tuples of Python values for sqlite3, in the order of columns (missing ones as NULL).
+    Missing numbers are NaN, which SQLite stores as NULL."""
+    values = []
+    for col in columns:
+        if col not in df:
+            values.append([None] * len(df))
+        elif col in DATE_COLUMNS:
+            dates = pd.to_datetime(df[col], errors="coerce").to_numpy(dtype="datetime64[ns]")
+            text = np.datetime_as_string(dates, unit="s").astype(object)
+            text[np.isnat(dates)] = None
+            values.append(text.tolist())
+        elif column_type(col) == "TEXT":
+            values.append(df[col].astype(object).where(df[col].notna(), None).tolist())
+        else:
+            values.append(df[col].tolist())
+    return list(zip(*values))
+
+
+def from_records(rows, columns):
+    """Builds a frame with the types of the round table from rows read from the store."""
+    df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+    for col in columns:
+        if col in DATE_COLUMNS:
+            df[col] = pd.to_datetime(df[col], format=DATE_FORMAT)
+        elif column_type(col) == "REAL":
+            df[col] = df[col].astype(float)
+        elif column_type(col) == "TEXT":
+            df[col] = df[col].where(df[col].notna(), np.nan)
+    return df
+
+
+def keyed(df):
+    """Returns the rows of df that have a Name and Round #, keeping the last of rounds listed twice."""
+    has_key = df["Name"].notna() & pd.to_numeric(df["Round #"], errors="coerce").notna()
+    rows = df[has_key.to_numpy()]
+    return rows[~rows.duplicated(KEY_COLUMNS, keep="last").to_numpy()]
+
+
+def key_hashes(names, rounds):
+    """Hashes (Name, Round #) keys given as arrays of Names and integer Round #s, the Key of round_signatures."""
+    return pd.util.hash_pandas_object(pd.DataFrame({"Name": names, "Round #": rounds}), index=False).to_numpy()
+
+
+def round_signatures(df):
+    """Returns the Name and Round # of each stored round of df with a hash of the key (Key) and of the whole row (Row),
+    to find the rounds that changed."""
+    rows = keyed(df)
+    keys = pd.DataFrame({"Name": rows["Name"].to_numpy(), "Round #": rows["Round #"].astype(float).astype(int).to_numpy()})
+    keys["Key"] = key_hashes(keys["Name"].to_numpy(), keys["Round #"].to_numpy())
+    keys["Row"] = pd.util.hash_pandas_object(rows.reindex(columns=ROUND_COLUMNS), index=False).to_numpy()
+    return keys
+
+
+def changed_rounds(previous_signatures, df):
+    """Compares df with the rounds in previous_signatures (see round_signatures). Returns the rounds of df that are new
+    or changed, the (Name, Round #) keys that are no longer in df and the signatures of df."""
+    rows = keyed(df)
+    signatures = round_signatures(rows)
+    changed = ~signatures["Row"].isin(previous_signatures["Row"]).to_numpy()
+    gone = ~previous_signatures["Key"].isin(signatures["Key"]).to_numpy()
+    removed = previous_signatures.loc[gone, KEY_COLUMNS].itertuples(index=False, name=None)
+    return rows[changed], list(removed), signatures
+
+
+def upsert_rounds(conn, rows):
+    """Inserts the rounds of rows (see keyed), or updates them where their (Name, Round #) is stored already."""
+    conn.executemany(UPSERT_ROUNDS, to_records(rows, ROUND_COLUMNS))
+
+
+def delete_rounds(conn, keys):
+    """Deletes the rounds with the given (Name, Round #) keys."""
+    conn.executemany('DELETE FROM rounds WHERE "Name" = ? AND "Round #" = ?', [(name, int(number)) for name, number in keys])
+
+
+def save_changes(path, previous_signatures, df):
+    """Writes the rounds of df that changed since previous_signatures (see round_signatures) to the store at path, and deletes
+    the ones that are gone. Returns the signatures of df, to pass in next time, and the number of rounds written or deleted."""
+    changed, removed, signatures = changed_rounds(previous_signatures, df)
+    if len(changed) or len(removed):
+        with connect(path) as conn:
+            upsert_rounds(conn, changed)
+            delete_rounds(conn, removed)
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('edited', '1')")
+            conn.execute("DELETE FROM meta WHERE key = 'snapshot'")
+    return signatures, len(changed) + len(removed)
+
+
+def replace_portfolio(path, df, source=None):
+    """Replaces the portfolio stored at path with df, loaded from the source with cache key source (see cache.source_key).
+    Returns the signatures of its rounds (see round_signatures)."""
+    rows = keyed(df)
+    with connect(path) as conn:
+        conn.execute("DELETE FROM rounds")
+        conn.execute("DELETE FROM totals")
+        upsert_rounds(conn, rows)
+        conn.execute("DELETE FROM meta")
+        conn.execute("INSERT INTO meta VALUES ('source', ?)", (source,))
+    return round_signatures(rows)
+
+
+def update_source(path, source):
+    """Records that the portfolio stored at path now holds the rounds of the source with cache key source (see
+    cache.source_key), e.g. after the changes made to its file were taken in."""
+    with connect(path) as conn:
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('source', ?)", (source,))
+
+
+def stored_source(path):
+    """Returns the cache key of the source the portfolio stored at path was loaded from (None if nothing is stored) and whether
+    it has been edited since."""
+    if not os.path.exists(path):
+        return None, False
+    with connect(path) as conn:
+        meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+    return meta.get("source"), "edited" in meta
+
+
+def mark_snapshot(path, version):
+    """Records that the portfolio and totals stored at path are version version of the snapshot of their source (see
+    snapshot.write_snapshot), until they are next written."""
+    with connect(path) as conn:
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('snapshot', ?)", (str(version),))
+
+
+def stored_snapshot(path):
+    """Returns the version of the snapshot the portfolio stored at path matches (see mark_snapshot), or None."""
+    if not os.path.exists(path):
+        return None
+    with connect(path) as conn:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'snapshot'").fetchone()
+    return int(row[0]) if row else None
+
+
+def read_rounds(path, where="", params=()):
+    with connect(path) as conn:
+        rows = conn.execute(f"SELECT {quoted(ROUND_COLUMNS)} FROM rounds {where} ORDER BY rowid", params).fetchall()
+    df = from_records(rows, ROUND_COLUMNS)
+    # Only portfolios merged from several files have a Source
+    return df if df[SOURCE_COLUMN].notna().any() else df.drop(columns=SOURCE_COLUMN)
+
+
+def read_portfolio(path):
+    """Returns the round table stored at path, in the order the rounds were first stored."""
+    return read_rounds(path)
+
+
+def read_company(path, name):
+    """Returns the rounds of one company stored at path, looked up on the (Name, Round #) index."""
+    return read_rounds(path, 'WHERE "Name" = ?', (name,))
+
+
+def write_totals(path, summary_df, names=None):
+    """Stores the total position of each company (see calculations.calculate_total_position). If names is given only
+    the totals of those companies are replaced."""
+    with connect(path) as conn:
+        if names is None:
+            conn.execute("DELETE FROM totals")
+        else:
+            conn.executemany('DELETE FROM totals WHERE "Name" = ?', [(name,) for name in names])
+            summary_df = summary_df[summary_df["Name"].isin(names)]
+        conn.execute("DELETE FROM meta WHERE key = 'snapshot'")
+        conn.executemany(
+            f"INSERT INTO totals ({quoted(TOTALS_COLUMNS)}) VALUES ({', '.join('?' * len(TOTALS_COLUMNS))})",
+            to_records(summary_df, TOTALS_COLUMNS),
+        )
+
+
+def read_totals(path, names=None):
+    """Returns the total positions stored at path, of all companies or only of names, sorted by Dilution Increase then
+    Name."""
+    where, params = "", ()
+    if names is not None:
+        names = list(names)
+        where, params = f'WHERE "Name" IN ({", ".join("?" * len(names))})', names
+    with connect(path) as conn:
+        rows = conn.execute(
+            f'SELECT {quoted(TOTALS_COLUMNS)} FROM totals {where} ORDER BY "Dilution Increase" DESC, "Name"', params
+        ).fetchall()
+    return from_records(rows, TOTALS_COLUMNS)
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+
+from loading import PERCENTAGE_COLUMNS
+
+# Generates made up portfolios shaped like Round.csv, for benchmarking and trying things out
+
+ROUND_NAMES = ["Pre-Seed", "Seed", "SAFE", "Series A", "Series B", "Series C", "Series D", "Bridge"]
+
+
+def generate_round_table(companies=100, rounds=8, seed=0):
+    """Returns a round table (as loaded by loading.read_round_csv) for companies companies with 1 to rounds rounds each.
+    About one round in ten is Estimated (Round Ownership given, Post Money or Total Invested missing), one in fifteen
+    is an Adjustment carrying its own Dilution (est), and values are sprinkled with zeros and NaNs."""
+    rng = np.random.default_rng(seed)
+    counts = rng.integers(1, rounds + 1, size=companies)
+    n = int(counts.sum())
+    company = np.repeat(np.arange(companies), counts)
+    starts = np.repeat(np.cumsum(counts) - counts, counts)
+    round_number = np.arange(n) - starts + 1
+
+    # Valuations step up from round to round within each company
+    step_up = np.where(round_number == 1, rng.uniform(2e6, 1e7, n), rng.lognormal(0.6, 0.5, n))
+    post_money = pd.Series(step_up).groupby(company).cumprod().to_numpy()
+    round_ownership = rng.uniform(0.05, 0.3, n)
+    total_invested = post_money * round_ownership
+    premoney = post_money - total_invested
+    invested = np.where(rng.random(n) < 0.4, total_invested * rng.uniform(0.01, 0.1, n), 0.0)
+
+    round_name = np.array(ROUND_NAMES, dtype=object)[np.minimum(round_number - 1, len(ROUND_NAMES) - 1)]
+    estimated = np.where(rng.random(n) < 0.1, "Y", "N").astype(object)
+    adjustment = (round_number > 2) & (rng.random(n) < 1 / 15)
+    round_name[adjustment] = "Adjustment"
+    dilution = np.where(adjustment, rng.uniform(0.8, 3.0, n), 0.0)
+
+    # Estimated rounds only know the ownership and one of the amounts
+    missing_post_money = (estimated == "Y") & (rng.random(n) < 0.5)
+    post_money = np.where(missing_post_money, 0.0, post_money)
+    total_invested = np.where((estimated == "Y") & ~missing_post_money, 0.0, total_invested)
+    premoney = np.where(estimated == "Y", 0.0, premoney)
+    # Gaps like a real export: Premoney left as 0 for the recalculation to fill in, and the odd missing value
+    premoney = np.where(rng.random(n) < 0.15, 0.0, premoney)
+    premoney = np.where(rng.random(n) < 0.03, np.nan, premoney)
+    increase = np.where(rng.random(n) < 0.05, np.nan, 0.0)
+
+    return pd.DataFrame({
+        "Name": np.array([f"Company {i:05d}" for i in range(companies)], dtype=object)[company],
+        "Round #": round_number,
+        "Round Name": round_name,
+        "Date": pd.Timestamp("2015-01-01") + pd.to_timedelta(round_number * rng.integers(120, 540, n), unit="D"),
+        "Total Invested": total_invested,
+        "Estimated": estimated,
+        "Premoney": premoney,
+        "Post Money": post_money,
+        "Round Ownership": round_ownership,
+        "Invested": invested,
+        "My Ownership": 0.0,
+        "Increase (round/round)": increase,
+        "Dilution (est)": dilution,
+        "Increase (Value)": 0.0,
+        "Notes": np.nan,
+    })
+
+
+def write_round_csv(df, path, title="Round data"):
+    """Writes a round table as a Round.csv export: a title line, percentages as percent and dates as YYYY-MM-DD."""
+    export = df.copy()
+    export[PERCENTAGE_COLUMNS] = export[PERCENTAGE_COLUMNS] * 100
+    with open(path, "w", newline="") as f:
+        f.write(title + "\n")
+        export.to_csv(f, index=False, date_format="%Y-%m-%d")
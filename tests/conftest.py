@@ -0,0 +1,15 @@
+import os
+import sys
+import tempfile
+
+# The modules are run from the repository root, as streamlit run RoundCalc.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The cache, store, snapshots and exports of the app go to a folder of their own rather than the user's
+_state_dir = tempfile.mkdtemp(prefix="roundcalc-tests-")
+for _name, _default in [
+    ("ROUNDCALC_CACHE_DIR", "cache"),
+    ("ROUNDCALC_STORE_DIR", "store"),
+    ("ROUNDCALC_EXPORT_DIR", "export"),
+]:
+    os.environ.setdefault(_name, os.path.join(_state_dir, _default))
@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+
+# The row by row recalculation the columnar one in calculations.py replaced, as it was in functions.py before, without
+# the debug output and the display of the changes. Only used to check the columnar version gives the same results.
+# An Adjustment is divided as numpy divides, so a Dilution (est) of 0 before it gives inf rather than raising.
+
+
+def update_calculated_columns(original_df):
+    df = original_df.copy()
+
+    if 'Total' in df['Name'].values:
+        df = df[df['Name'] != 'Total']
+
+    all_filtered_dfs = []
+    for name in df['Name'].unique():
+        filtered_df = df[df['Name'] == name].copy()
+        for index, row in filtered_df.iterrows():
+            if row['Round Name'] == 'Adjustment':
+                if pd.notna(row["Dilution (est)"]) and row["Dilution (est)"] != 0.0:
+                    continue
+            if row['Estimated'] == 'Y' and row['Round Ownership'] > 0:
+                if row["Total Invested"] > 0:
+                    post_money_overwrite = row["Total Invested"] / row["Round Ownership"]
+                    filtered_df.loc[index, 'Post Money'] = post_money_overwrite
+                    row['Post Money'] = post_money_overwrite
+                elif row["Post Money"] > 0:
+                    total_invested_overwrite = row["Post Money"] * row["Round Ownership"]
+                    filtered_df.loc[index, 'Total Invested'] = total_invested_overwrite
+                    row['Total Invested'] = total_invested_overwrite
+
+            if (pd.notna(row["Premoney"]) and pd.notna(row["Total Invested"]) and row["Post Money"] == 0):
+                postmoney_overwrite = row["Premoney"] + row["Total Invested"]
+                filtered_df.loc[index, 'Post Money'] = postmoney_overwrite
+                row['Post Money'] = postmoney_overwrite
+            elif (row["Premoney"] == 0) and pd.notna(row["Total Invested"]) and pd.notna(row["Post Money"]):
+                premoney_overwrite = row["Post Money"] - row["Total Invested"]
+                filtered_df.loc[index, 'Premoney'] = premoney_overwrite
+                row['Premoney'] = premoney_overwrite
+
+            if (pd.notna(row["Total Invested"]) and pd.notna(row["Post Money"]) and row["Post Money"] > 0):
+                ownership_overwrite = row["Total Invested"] / row["Post Money"]
+                filtered_df.loc[index, 'Round Ownership'] = ownership_overwrite
+                row['Round Ownership'] = ownership_overwrite
+
+            if (pd.notna(row["Invested"]) and pd.notna(row["Post Money"]) and row["Post Money"] > 0):
+                ownership_overwrite = row["Invested"] / row["Post Money"]
+                filtered_df.loc[index, 'My Ownership'] = ownership_overwrite
+
+        for index, row in filtered_df.iterrows():
+            round_number = int(row["Round #"])
+            if round_number > 1:
+                previous_row = df.loc[(df["Round #"] == round_number - 1) & (df["Name"] == name)].squeeze()
+                if pd.notna(previous_row["Post Money"]) and pd.notna(row["Post Money"]) and previous_row["Post Money"] > 0:
+                    calculated_increase = row["Post Money"] / previous_row["Post Money"]
+                    filtered_df.loc[index, 'Increase (round/round)'] = calculated_increase
+                    row['Increase (round/round)'] = calculated_increase
+                if pd.notna(row["Increase (round/round)"]) and pd.notna(row["Round Ownership"]):
+                    round_dilution = 1 - row['Round Ownership']
+                    increase_round = row["Increase (round/round)"]
+                    if row['Round Name'] != 'Adjustment':
+                        final_dilution = increase_round * round_dilution
+                        filtered_df.loc[index, 'Dilution (est)'] = final_dilution
+                        row['Dilution (est)'] = final_dilution
+                    else:
+                        previous_rows = filtered_df.loc[(filtered_df["Round #"] < round_number) & (filtered_df["Name"] == name) & (filtered_df["Round #"] != 1)]
+                        previous_dilution_product = 1.0
+                        for prev_index, prev_row in previous_rows.iterrows():
+                            if pd.notna(prev_row["Dilution (est)"]):
+                                previous_dilution_product *= prev_row["Dilution (est)"]
+                        final_dilution = np.float64(row['Dilution (est)']) / previous_dilution_product
+                        filtered_df.loc[index, "Dilution (est)"] = final_dilution
+                        row['Dilution (est)'] = final_dilution
+
+        all_filtered_dfs.append(filtered_df)
+
+    updated_df = pd.concat(all_filtered_dfs, ignore_index=True) if all_filtered_dfs else df.iloc[:0]
+    if updated_df.empty:
+        return df.copy()
+    merged_df = pd.merge(original_df, updated_df, on=['Name', 'Round #'], how='left', suffixes=('', '_updated'))
+    for col in ['Premoney', 'Post Money', 'Round Ownership', 'My Ownership', 'Increase (round/round)', 'Dilution (est)']:
+        if f'{col}_updated' in merged_df.columns:
+            merged_df[col] = merged_df[f'{col}_updated'].combine_first(merged_df[col])
+    merged_df.drop(columns=[col for col in merged_df.columns if col.endswith('_updated')], inplace=True)
+    return merged_df
+
+
+def calculate_increase_value(original_df):
+    df = original_df.copy()
+    df["Increase (Value)"] = 0.0
+    for name, group in df.groupby('Name'):
+        for i in range(len(group)):
+            invested = group.iloc[i]["Invested"]
+            if invested > 0:
+                dilution_multiplier = 1.0
+                for j in range(i + 1, len(group)):
+                    if pd.notna(group.iloc[j]["Dilution (est)"]):
+                        dilution_multiplier *= group.iloc[j]["Dilution (est)"]
+                df.loc[group.iloc[i].name, "Increase (Value)"] = invested * dilution_multiplier
+    return df
+
+
+def process_data(df):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return calculate_increase_value(update_calculated_columns(df))
@@ -0,0 +1,102 @@
+import os
+
+from streamlit.testing.v1 import AppTest
+
+from calculations import change_log, process_data
+from loading import read_round_csv
+import store
+from store import read_company
+from synthetic import generate_round_table, write_round_csv
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "RoundCalc.py")
+
+
+def load_app(folder):
+    """Runs the app with the .csv files of folder loaded."""
+    at = AppTest.from_file(APP, default_timeout=120).run()
+    at.text_input(key="load_folder").set_value(str(folder)).run()
+    assert not at.exception, at.exception
+    return at
+
+
+def recalculate(at, show_changes="Show Changes Summary"):
+    at.sidebar.radio[0].set_value("Check & Calculate").run()
+    at.radio(key="changes_view_radio").set_value(show_changes).run()
+    next(button for button in at.button if button.label == "Recalculate Data and Total Position").click().run()
+    assert not at.exception, at.exception
+    return at.session_state.change_set
+
+
+def test_first_incremental_recalculation_shows_the_changes_of_the_loaded_file(tmp_path):
+    write_round_csv(generate_round_table(40, 6, seed=4), tmp_path / "Round.csv")
+    expected = []
+    # Read as the app reads it, the default reader rounds some numbers differently in the last digit
+    process_data(read_round_csv(tmp_path / "Round.csv", engine="pyarrow")[0], lambda merged_df: expected.append(change_log(merged_df)))
+
+    at = load_app(tmp_path)
+    assert at.session_state.incremental_recalc
+    changes = recalculate(at)
+    assert len(expected[0]) > 0
+    assert changes[["Name", "Round #", "Column"]].astype(object).equals(expected[0][["Name", "Round #", "Column"]].astype(object))
+
+
+def test_session_picking_up_a_recalculated_snapshot_shows_the_changes_of_recalculating_it(tmp_path):
+    write_round_csv(generate_round_table(40, 6, seed=5), tmp_path / "Round.csv")
+    first, other = load_app(tmp_path), load_app(tmp_path)
+    recalculate(first)
+    # The other session switches to the snapshot written by the recalculation
+    other.run()
+    assert other.session_state.snapshot["version"] == first.session_state.snapshot["version"]
+
+    expected = []
+    process_data(other.session_state.edited_df, lambda merged_df: expected.append(change_log(merged_df)))
+    changes = recalculate(other)
+    assert len(expected[0]) > 0
+    assert changes[["Name", "Round #", "Column"]].astype(object).equals(expected[0][["Name", "Round #", "Column"]].astype(object))
+
+
+def test_loading_another_file_keeps_the_saved_edits_of_the_first(tmp_path):
+    first_folder, other_folder = tmp_path / "first", tmp_path / "other"
+    first_folder.mkdir()
+    other_folder.mkdir()
+    write_round_csv(generate_round_table(30, 6, seed=7), first_folder / "Round.csv")
+    write_round_csv(generate_round_table(30, 6, seed=8), other_folder / "Round.csv")
+    first = load_app(first_folder)
+    recalculate(first)
+    load_app(other_folder)
+
+    again = load_app(first_folder)
+    assert again.session_state.loaded_from_store
+    assert again.session_state.edited_df["Dilution (est)"].equals(first.session_state.edited_df["Dilution (est)"])
+
+
+def test_browse_companies_with_a_row_without_a_name(tmp_path):
+    df = generate_round_table(10, 4, seed=9)
+    df.loc[0, "Name"] = None
+    write_round_csv(df, tmp_path / "Round.csv")
+    at = load_app(tmp_path)
+    at.sidebar.radio[0].set_value("Browse Companies").run()
+    assert not at.exception, at.exception
+    names = at.radio(key="name_select_radio")
+    assert list(names.options) == list(df["Name"].dropna().unique())
+    names.set_value(names.options[-1]).run()
+    assert not at.exception, at.exception
+
+
+def test_browse_companies_reads_a_stored_company_from_the_store(tmp_path, monkeypatch):
+    write_round_csv(generate_round_table(20, 5, seed=10), tmp_path / "Round.csv")
+    recalculate(load_app(tmp_path))
+    read = []
+    monkeypatch.setattr(store, "read_company", lambda path, name: read.append(name) or read_company(path, name))
+    at = load_app(tmp_path)
+    assert at.session_state.loaded_from_store
+    at.sidebar.radio[0].set_value("Browse Companies").run()
+    name = at.radio(key="name_select_radio").options[3]
+    at.radio(key="name_select_radio").set_value(name).run()
+    assert not at.exception, at.exception
+    shown = at.dataframe[0].value
+    expected = at.session_state.edited_df
+    expected = expected[expected["Name"] == name]
+    assert list(shown["Round #"]) == list(expected["Round #"])
+    assert list(shown["Dilution (est)"]) == list(expected["Dilution (est)"])
+    assert read[-1] == name
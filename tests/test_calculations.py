@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+
+from calculations import (
+    calculate_total_position,
+    change_log,
+    portfolio_totals,
+    process_data,
+    process_data_parallel,
+    recalculate_changed_companies,
+    update_total_position,
+)
+from synthetic import generate_round_table
+
+import reference
+
+
+def test_incremental_matches_full_recalculation_after_edits():
+    df = generate_round_table(200, 8, seed=3)
+    cache = {}
+    reported = []
+    rng = np.random.default_rng(0)
+    for step in range(6):
+        incremental = recalculate_changed_companies(df, cache, lambda merged_df: reported.append(change_log(merged_df)))
+        full = process_data(df)
+        pd.testing.assert_frame_equal(incremental, full)
+        # Every change the full recalculation makes is reported, including those of companies taken from the cache
+        merged = []
+        process_data(df, lambda merged_df: merged.append(change_log(merged_df)))
+        pd.testing.assert_frame_equal(reported[-1], merged[-1])
+        # Carry on from the result, as the app does, with a few rounds edited
+        df = incremental.copy()
+        rows = rng.choice(len(df), size=3, replace=False)
+        df.loc[rows, "Post Money"] = df.loc[rows, "Post Money"] * (1 + step / 10)
+
+
+def test_unchanged_input_reports_the_cached_changes():
+    df = generate_round_table(50, 6, seed=1)
+    cache = {}
+    first = []
+    recalculate_changed_companies(df, cache, lambda merged_df: first.append(change_log(merged_df)))
+    again = []
+    recalculate_changed_companies(df, cache, lambda merged_df: again.append(change_log(merged_df)))
+    assert len(first[-1]) > 0
+    pd.testing.assert_frame_equal(again[-1], first[-1])
+
+
+def test_matches_the_row_by_row_reference():
+    for seed in range(4):
+        df = generate_round_table(40, 8, seed=seed)
+        rng = np.random.default_rng(seed)
+        # Adjustments without their own Dilution (est), zeros and NaNs in the amounts, and rows not named yet
+        later = np.flatnonzero(df["Round #"] >= 2)
+        picked = rng.choice(later, 5, replace=False)
+        df.loc[picked[:3], ["Round Name", "Dilution (est)"]] = ["Adjustment", 0.0]
+        df.loc[picked[3:], ["Round Name", "Dilution (est)"]] = ["Adjustment", np.nan]
+        df.loc[rng.choice(len(df), 5, replace=False), "Post Money"] = 0.0
+        df.loc[rng.choice(len(df), 5, replace=False), "Total Invested"] = np.nan
+        df.loc[rng.choice(len(df), 5, replace=False), "Round Ownership"] = np.nan
+        df.loc[rng.choice(len(df), 5, replace=False), "Invested"] = np.nan
+        unnamed = df.iloc[[0, 1]].assign(Name=np.nan, **{"Round #": [1, 2]})
+        df = pd.concat([df, unnamed], ignore_index=True)
+        assert (df["Estimated"] == "Y").any() and (df["Round Name"] == "Adjustment").any()
+        pd.testing.assert_frame_equal(process_data(df), reference.process_data(df), check_dtype=False)
+
+
+def test_parallel_matches_serial():
+    df = generate_round_table(120, 8, seed=4)
+    unnamed = df.iloc[[3]].assign(Name=np.nan)
+    df = pd.concat([df, unnamed], ignore_index=True)
+    shuffled = df.sample(frac=1, random_state=4).reset_index(drop=True)
+    for table in (df, shuffled):
+        pd.testing.assert_frame_equal(process_data_parallel(table, workers=3, min_rows=0), process_data(table))
+
+
+def test_updated_totals_match_a_full_recalculation_after_edits():
+    df = process_data(generate_round_table(60, 6, seed=11))
+    cache = {}
+    update_total_position(cache, df)
+    rng = np.random.default_rng(11)
+    names = df["Name"].unique()
+    # Companies without an investment have no Dilution Increase, and are put in Name order however they were updated
+    edits = [
+        lambda df: df.assign(Invested=df["Invested"].mask(df["Name"] == names[5], 0.0)),
+        lambda df: df.assign(Invested=df["Invested"].mask(df["Name"].isin(names[10:13]), df["Invested"] * 2)),
+        lambda df: df[df["Name"] != names[20]],
+        lambda df: pd.concat([df, df[df["Name"] == names[0]].assign(Name="Company New")], ignore_index=True),
+        lambda df: df.iloc[rng.permutation(len(df))],
+    ]
+    for edit in edits:
+        df = process_data(edit(df).reset_index(drop=True))
+        summary, _ = update_total_position(cache, df)
+        full = calculate_total_position(df)
+        pd.testing.assert_frame_equal(summary, full)
+        pd.testing.assert_series_equal(cache["totals"], portfolio_totals(full), rtol=1e-9)
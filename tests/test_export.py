@@ -0,0 +1,21 @@
+import pandas as pd
+
+from calculations import process_data
+from export import export_tables
+from functions import add_new_row
+from loading import compact_round_table
+from synthetic import generate_round_table
+
+
+def test_export_after_adding_a_row_in_the_editor(tmp_path):
+    df = process_data(generate_round_table(20, 5, seed=9))
+    # Dated now, to the fraction of a second
+    df = compact_round_table(pd.concat([df, add_new_row(df)], ignore_index=True))
+    paths = export_tables({"rounds": df}, tmp_path, ["csv", "parquet", "xlsx"], rows=7)
+    assert [p.rsplit("/", 1)[-1] for p in paths] == ["rounds.csv", "rounds.parquet", "roundcalc.xlsx"]
+
+    written = pd.read_csv(tmp_path / "rounds.csv", parse_dates=["Date"])
+    assert len(written) == len(df)
+    assert written["Date"].iloc[-1] == df["Date"].iloc[-1]
+    pd.testing.assert_series_equal(written["Post Money"], df["Post Money"])
+    pd.testing.assert_frame_equal(pd.read_parquet(tmp_path / "rounds.parquet"), df)
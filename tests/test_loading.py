@@ -0,0 +1,85 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import batch
+from calculations import process_data
+from loading import DISPLAY_RATIO_COLUMNS, compact_round_table, convert_round_csv, read_round_csv
+from synthetic import generate_round_table, write_round_csv
+
+
+class Unseekable(io.BytesIO):
+    def seekable(self):
+        return False
+
+
+def write_export(tmp_path, companies=300):
+    path = tmp_path / "Round.csv"
+    write_round_csv(generate_round_table(companies, 8, seed=2), path)
+    with open(path, "a") as f:
+        # A value that isn't a number and a row with too many fields
+        f.write("Company X,1,Seed,2020-01-01,abc,N,0,0,10,0,0,0,0,0,\n")
+        f.write("Company Y,1,Seed,2020-01-01,1,N,0,0,10,0,0,0,0,0,,extra\n")
+    return path
+
+
+def test_convert_round_csv_matches_reading_the_whole_file(tmp_path):
+    path = write_export(tmp_path)
+    df, bad_rows = read_round_csv(path)
+    report = convert_round_csv(path, tmp_path / "Round.parquet", chunksize=97)
+    converted = pd.read_parquet(tmp_path / "Round.parquet")
+    # Missing text comes back from Parquet as None rather than NaN
+    converted["Notes"] = converted["Notes"].where(converted["Notes"].notna(), np.nan)
+    pd.testing.assert_frame_equal(converted, df, check_dtype=False)
+    pd.testing.assert_frame_equal(report.reset_index(drop=True), bad_rows, check_dtype=False)
+    assert set(report["Problem"]) == {"not a number", "wrong number of fields, row skipped"}
+
+
+def test_batch_convert_writes_parquet(tmp_path, capsys):
+    path = write_export(tmp_path, 20)
+    out = tmp_path / "out"
+    assert batch.main([str(path), "--convert", "--chunksize", "10", "--output-dir", str(out)]) == 0
+    assert len(pd.read_parquet(out / "Round.parquet")) == len(read_round_csv(path)[0])
+    assert "not a number" in capsys.readouterr().err
+
+
+def test_float32_ratios_leave_the_recalculation_unchanged():
+    df = generate_round_table(300, 8, seed=6)
+    # Rounds without a previous Post Money keep the Increase (round/round) they were given
+    df["Increase (round/round)"] = np.random.default_rng(6).uniform(1, 3, len(df)) / 3
+    full = process_data(df)
+    compact = process_data(compact_round_table(df, float32_ratios=True))
+    for col in full.columns:
+        if col in DISPLAY_RATIO_COLUMNS:
+            np.testing.assert_allclose(compact[col].astype(float), full[col], rtol=1e-6)
+        else:
+            assert compact[col].astype(full[col].dtype).equals(full[col]), col
+
+
+def test_numbers_with_any_formatting_are_read(tmp_path):
+    path = tmp_path / "Round.csv"
+    write_round_csv(generate_round_table(3, 1, seed=1), path)
+    with open(path, "a") as f:
+        f.write('Company X,1,Seed,2020-01-01,£1000,N,"€2,500",US$3500,28.6%,¥10,0,2.5x,0,0,\n')
+    df, bad_rows = read_round_csv(path)
+    row = df.iloc[-1]
+    assert (row["Total Invested"], row["Premoney"], row["Post Money"], row["Increase (round/round)"]) == (1000, 2500, 3500, 2.5)
+    assert row["Round Ownership"] == pytest.approx(0.286) and row["Invested"] == 10
+    assert bad_rows.empty
+
+
+def test_pyarrow_reports_the_same_lines(tmp_path):
+    path = write_export(tmp_path, 20)
+    # A bad value after the skipped row, which is numbered from the lines before it
+    with open(path, "a") as f:
+        f.write("Company Z,1,Seed,2020-01-01,xyz,N,0,0,10,0,0,0,0,0,\n")
+    df, bad_rows = read_round_csv(path)
+    arrow_df, arrow_bad_rows = read_round_csv(path, engine="pyarrow")
+    assert list(arrow_df["Name"]) == list(df["Name"])
+    assert list(arrow_bad_rows["Line"]) == list(bad_rows["Line"])
+    assert list(arrow_bad_rows["Problem"]) == list(bad_rows["Problem"])
+    # A skipped row that can't be looked up leaves every row without a line, rather than numbering them wrongly
+    _, unlocated = read_round_csv(Unseekable(path.read_bytes()), engine="pyarrow")
+    assert unlocated["Line"].isna().all() and len(unlocated) == len(bad_rows)
@@ -0,0 +1,23 @@
+import numpy as np
+import pandas as pd
+
+from scenarios import log_kept_shares, percentile_bands, random_draws, simulate
+
+
+def test_round_sizes_are_drawn_in_chunks_within_their_bounds():
+    kept = log_kept_shares(100, 7, 3, 0.1, 0.25, seed=1, chunk_values=50)
+    assert kept.shape == (100, 7)
+    assert (kept <= 3 * np.log(0.9)).all() and (kept >= 3 * np.log(0.75)).all()
+    # The same round sizes whatever the share sold, so selling more keeps less in every future
+    assert (log_kept_shares(100, 7, 3, 0.2, 0.35, seed=1, chunk_values=50) < kept).all()
+    np.testing.assert_allclose(kept.mean(), 3 * np.mean(np.log1p(-np.linspace(0.1, 0.25, 10001))), rtol=1e-2)
+
+
+def test_draws_hold_no_array_per_round():
+    draws = random_draws(200, 30, 10)
+    assert all(np.ndim(value) <= 2 for value in draws.values())
+    positions = pd.DataFrame({"Invested": 1.0, "Value": 2.0, "Ownership": 0.1}, index=[f"c{i}" for i in range(30)])
+    values, ownership = simulate(positions, rounds=10, draws=draws)
+    bands = percentile_bands(positions, values, ownership)
+    assert values.shape == ownership.shape == (200, 30)
+    assert (bands["Ownership P95"].iloc[:-1] < 0.1).all()
@@ -0,0 +1,48 @@
+import numpy as np
+
+from calculations import CALCULATED_COLUMNS, process_data
+from synthetic import generate_round_table
+from validation import TOLERANCE, differs, validate
+
+
+def changed_by_recalculation(df):
+    """The (Name, Round #, Column) of every calculated value process_data changes, leaving out an Adjustment's Dilution
+    (est), which is divided by the rounds before it and not checked."""
+    recalculated = process_data(df)
+    changed = set()
+    for col in CALCULATED_COLUMNS:
+        rows = differs(df[col].to_numpy(dtype=float), recalculated[col].to_numpy(dtype=float), TOLERANCE)
+        if col == "Dilution (est)":
+            rows &= (df["Round Name"] != "Adjustment").to_numpy()
+        changed |= {(name, round_number, col) for name, round_number in zip(df["Name"][rows], df["Round #"][rows])}
+    return changed
+
+
+def test_violations_are_the_values_recalculating_changes():
+    df = generate_round_table(500, 8, seed=1)
+    # Once recalculated, the rounds after a filled in Post Money are still listed, as recalculating again changes them
+    for table in (df, process_data(df)):
+        violations = validate(table)
+        violations = violations[violations["Expected"].notna()]
+        listed = set(zip(violations["Name"], violations["Round #"], violations["Column"]))
+        assert len(listed) > 0
+        assert listed == changed_by_recalculation(table)
+
+
+def test_post_money_and_premoney_of_zero_is_listed():
+    df = generate_round_table(5, 3, seed=2)
+    df.loc[0, ["Premoney", "Post Money", "Estimated"]] = [0.0, 0.0, "N"]
+    violations = validate(df)
+    row = violations[(violations["Name"] == df.loc[0, "Name"]) & (violations["Round #"] == df.loc[0, "Round #"])]
+    post_money = row[row["Column"] == "Post Money"]
+    assert len(post_money) == 1 and "Premoney" not in set(row["Column"])
+    assert post_money["Expected"].iloc[0] == df.loc[0, "Total Invested"]
+    assert process_data(df).loc[0, "Post Money"] == df.loc[0, "Total Invested"]
+
+
+def test_adjustment_without_dilution_is_listed():
+    df = generate_round_table(5, 4, seed=2)
+    later = np.flatnonzero(df["Round #"] >= 2)[0]
+    df.loc[later, ["Round Name", "Dilution (est)"]] = ["Adjustment", 0.0]
+    violations = validate(df)
+    assert "Adjustment needs its own Dilution (est)" in set(violations["Rule"])
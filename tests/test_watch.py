@@ -0,0 +1,57 @@
+import pandas as pd
+
+from loading import read_round_csv
+from store import changed_rounds, round_signatures
+from synthetic import generate_round_table, write_round_csv
+from watch import apply_round_changes
+
+
+def test_rounds_edited_deleted_and_inserted_in_the_file_are_applied(tmp_path):
+    path = tmp_path / "Round.csv"
+    df = generate_round_table(20, 5, seed=12)
+    write_round_csv(df, path)
+    loaded, _ = read_round_csv(path, engine="pyarrow")
+    signatures = round_signatures(loaded)
+
+    # A round edited, one deleted and one added after the last round of its company
+    names = df["Name"].unique()
+    edited = df.index[df["Name"] == names[2]][0]
+    deleted = df.index[df["Name"] == names[7]][-1]
+    last = df.index[df["Name"] == names[11]][-1]
+    df.loc[edited, "Post Money"] *= 1.5
+    inserted = df.loc[[last]].assign(**{"Round #": df.loc[last, "Round #"] + 1, "Round Name": "Bridge"})
+    df = pd.concat([df.loc[:last], inserted, df.loc[last + 1:]]).drop(index=deleted).reset_index(drop=True)
+    write_round_csv(df, path)
+    reloaded, _ = read_round_csv(path, engine="pyarrow")
+
+    changed, removed, new_signatures = changed_rounds(signatures, reloaded)
+    assert list(zip(changed["Name"], changed["Round #"])) == [
+        (names[2], loaded.loc[edited, "Round #"]),
+        (names[11], inserted["Round #"].iloc[0]),
+    ]
+    assert removed == [(names[7], loaded.loc[deleted, "Round #"])]
+    assert new_signatures.equals(round_signatures(reloaded))
+
+    patched, companies = apply_round_changes(loaded, changed, removed)
+    assert sorted(companies) == sorted([names[2], names[7], names[11]])
+    pd.testing.assert_frame_equal(patched, reloaded)
+
+
+def test_rounds_only_edited_in_the_file_are_written_in_place(tmp_path):
+    path = tmp_path / "Round.csv"
+    df = generate_round_table(20, 5, seed=13)
+    write_round_csv(df, path)
+    loaded, _ = read_round_csv(path, engine="pyarrow")
+    signatures = round_signatures(loaded)
+
+    df.loc[[3, 30], "Invested"] += 1000.0
+    df["Notes"] = df["Notes"].astype(object)
+    df.loc[30, "Notes"] = "Follow on"
+    write_round_csv(df, path)
+    reloaded, _ = read_round_csv(path, engine="pyarrow")
+
+    changed, removed, _ = changed_rounds(signatures, reloaded)
+    assert list(changed.index) == [3, 30] and removed == []
+    patched, companies = apply_round_changes(loaded, changed, removed)
+    assert companies == list(df.loc[[3, 30], "Name"].unique())
+    pd.testing.assert_frame_equal(patched, reloaded)
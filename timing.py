@@ -0,0 +1,67 @@
+import cProfile
+import io
+import logging
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+# Timing of the stages of a run (loading, recalculation, increase value, totals, styling), without any Streamlit so it
+# can be used from the app, scripts and worker processes. Each stage is logged to the "roundcalc.timing" logger as well.
+
+log = logging.getLogger("roundcalc.timing")
+
+TIMING_COLUMNS = ["Stage", "Seconds", "Rows", "Peak MiB"]
+
+# Highest traced memory seen so far by each open stage of this thread, as the tracemalloc peak is reset for every stage
+_open_peaks = threading.local()
+
+
+@contextmanager
+def timed(timings, stage, rows=None, trace_memory=False):
+    """Times the block as stage and appends its row (a dict with TIMING_COLUMNS) to the list timings. The row is yielded
+    so Rows can be set once known. With trace_memory the peak memory allocated during the block is recorded with
+    tracemalloc, which slows the block down. Stages can be nested."""
+    record = {"Stage": stage, "Seconds": None, "Rows": rows, "Peak MiB": None}
+    if trace_memory:
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        peaks = _open_peaks.__dict__.setdefault("stack", [])
+        before, peak = tracemalloc.get_traced_memory()
+        if peaks:
+            peaks[-1] = max(peaks[-1], peak)
+        tracemalloc.reset_peak()
+        peaks.append(before)
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["Seconds"] = time.perf_counter() - start
+        if trace_memory:
+            highest = max(peaks.pop(), tracemalloc.get_traced_memory()[1])
+            if peaks:
+                peaks[-1] = max(peaks[-1], highest)
+            if started:
+                tracemalloc.stop()
+            record["Peak MiB"] = (highest - before) / 2**20
+        timings.append(record)
+        log.info("%s: %.4fs, %s rows%s", stage, record["Seconds"], record["Rows"],
+                 "" if record["Peak MiB"] is None else f", peak {record['Peak MiB']:.1f} MiB")
+
+
+def timings_frame(timings):
+    """Returns the recorded stages as a table, in the order they finished."""
+    return pd.DataFrame(timings, columns=TIMING_COLUMNS)
+
+
+def profiled(function, *args, limit=30, **kwargs):
+    """Runs function(*args, **kwargs) under cProfile. Returns its result and the top limit functions by cumulative time as text."""
+    profiler = cProfile.Profile()
+    result = profiler.runcall(function, *args, **kwargs)
+    report = io.StringIO()
+    pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(limit)
+    return result, report.getvalue()
@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+
+from calculations import company_round_order
+
+# Read-only checks of the rules calculations.recalculate_rounds enforces, in one columnar pass over the round table.
+# A value the recalculation would fill in (e.g. a Post Money of 0) is listed with the value it would get. A round
+# after one whose Post Money was filled in is still listed once recalculated, as the Increase (round/round) is taken
+# from the previous Post Money as loaded and recalculating again would change it.
+
+VIOLATION_COLUMNS = ["Name", "Round #", "Rule", "Column", "Value", "Expected", "Difference", "Tolerance"]
+
+# Relative difference allowed between a value and what the rule expects, to allow for rounding in the export
+TOLERANCE = 1e-4
+
+
+def differs(value, expected, tolerance):
+    """Marks where value differs from expected by more than tolerance, relative to expected. Both missing is no difference."""
+    with np.errstate(invalid="ignore"):
+        return ~np.isclose(value, expected, rtol=tolerance, atol=0.0, equal_nan=True)
+
+
+def violations_of(rule, column, broken, value, expected):
+    """Returns the rows marked in broken as a partial violation table, with the row position in Row."""
+    rows = np.flatnonzero(broken)
+    return pd.DataFrame({
+        "Row": rows,
+        "Rule": rule,
+        "Column": column,
+        "Value": np.broadcast_to(np.asarray(value, dtype=float), broken.shape)[rows],
+        "Expected": np.broadcast_to(np.asarray(expected, dtype=float), broken.shape)[rows],
+    })
+
+
+def validate(df, tolerance=TOLERANCE):
+    """Lists every value of df that breaks a rule of the recalculation, without changing df. Returns a table of
+    VIOLATION_COLUMNS in row order, Difference being Value - Expected and Tolerance the relative difference allowed."""
+    if df.empty:
+        return pd.DataFrame(columns=VIOLATION_COLUMNS)
+    named = (df["Name"].notna() & (df["Name"] != "Total")).to_numpy()
+    total_invested = df["Total Invested"].to_numpy(dtype=float)
+    premoney = df["Premoney"].to_numpy(dtype=float)
+    post_money = df["Post Money"].to_numpy(dtype=float)
+    loaded_post_money = post_money
+    round_ownership = df["Round Ownership"].to_numpy(dtype=float)
+    my_ownership = df["My Ownership"].to_numpy(dtype=float)
+    invested = df["Invested"].to_numpy(dtype=float)
+    increase = df["Increase (round/round)"].to_numpy(dtype=float)
+    dilution = df["Dilution (est)"].to_numpy(dtype=float)
+    is_adjustment = (df["Round Name"] == "Adjustment").to_numpy()
+    is_estimated = (df["Estimated"] == "Y").to_numpy()
+
+    # Adjustment rows that carry their own Dilution (est) are taken as entered
+    checked = named & ~(is_adjustment & ~np.isnan(dilution) & (dilution != 0.0))
+    later_round = df["Round #"].to_numpy(dtype=float) >= 2
+    # The rules are checked in the order the recalculation applies them, each on the values the ones before it would
+    # leave, so a wrong value is listed once rather than again by every rule that reads it
+    with np.errstate(divide="ignore", invalid="ignore"):
+        found = []
+
+        # Estimated rounds: Post Money = Total Invested / Round Ownership, or else Total Invested is taken as Post Money *
+        # Round Ownership for the rules below (the recalculation doesn't store it)
+        estimated = checked & is_estimated
+        found.append(violations_of("Estimated round needs a Round Ownership", "Round Ownership",
+                                   estimated & ~(round_ownership > 0), round_ownership, np.nan))
+        estimated &= round_ownership > 0
+        from_total_invested = estimated & (total_invested > 0)
+        found.append(violations_of("Estimated: Post Money = Total Invested / Round Ownership", "Post Money",
+                                   from_total_invested & differs(post_money, total_invested / round_ownership, tolerance),
+                                   post_money, total_invested / round_ownership))
+        post_money = np.where(from_total_invested, total_invested / round_ownership, post_money)
+        total_invested = np.where(estimated & ~from_total_invested & (post_money > 0), post_money * round_ownership, total_invested)
+
+        # Premoney + Total Invested = Post Money: a Post Money of 0 is the one that's wrong, or else a Premoney of 0
+        fill_post_money = checked & ~np.isnan(premoney) & ~np.isnan(total_invested) & (post_money == 0)
+        fill_premoney = checked & ~fill_post_money & (premoney == 0) & ~np.isnan(total_invested) & ~np.isnan(post_money)
+        complete = checked & ~fill_post_money & ~fill_premoney & ~np.isnan(premoney) & ~np.isnan(total_invested) & ~np.isnan(post_money)
+        found.append(violations_of("Premoney + Total Invested = Post Money", "Post Money",
+                                   (fill_post_money | complete) & differs(post_money, premoney + total_invested, tolerance),
+                                   post_money, premoney + total_invested))
+        found.append(violations_of("Premoney + Total Invested = Post Money", "Premoney",
+                                   fill_premoney & differs(premoney, post_money - total_invested, tolerance),
+                                   premoney, post_money - total_invested))
+        post_money = np.where(fill_post_money, premoney + total_invested, post_money)
+
+        # Ownership from the amounts
+        has_post_money = checked & (post_money > 0)
+        expected_round_ownership = total_invested / post_money
+        found.append(violations_of("Round Ownership = Total Invested / Post Money", "Round Ownership",
+                                   has_post_money & ~np.isnan(total_invested) & differs(round_ownership, expected_round_ownership, tolerance),
+                                   round_ownership, expected_round_ownership))
+        round_ownership = np.where(has_post_money & ~np.isnan(total_invested), expected_round_ownership, round_ownership)
+        found.append(violations_of("My Ownership = Invested / Post Money", "My Ownership",
+                                   has_post_money & ~np.isnan(invested) & differs(my_ownership, invested / post_money, tolerance),
+                                   my_ownership, invested / post_money))
+
+        # Chained Post Money: each round against the round before it in the same company, taking the previous round's
+        # Post Money as loaded, as the recalculation does
+        order, names, rounds = company_round_order(df)
+        sorted_post_money = post_money[order]
+        previous_post_money = np.r_[np.nan, loaded_post_money[order][:-1]]
+        follows = np.r_[False, (names.to_numpy()[1:] == names.to_numpy()[:-1]) & (rounds.to_numpy()[1:] == rounds.to_numpy()[:-1] + 1)]
+        chained = np.zeros(len(df), dtype=bool)
+        chained[order] = follows & (previous_post_money > 0) & ~np.isnan(sorted_post_money)
+        chained &= named & later_round
+        expected_increase = np.full(len(df), np.nan)
+        expected_increase[order] = sorted_post_money / previous_post_money
+        found.append(violations_of("Increase (round/round) = Post Money / previous Post Money", "Increase (round/round)",
+                                   chained & differs(increase, expected_increase, tolerance), increase, expected_increase))
+        increase = np.where(chained, expected_increase, increase)
+        found.append(violations_of("Dilution (est) = Increase (round/round) * (1 - Round Ownership)", "Dilution (est)",
+                                   named & ~is_adjustment & later_round & ~np.isnan(increase) & ~np.isnan(round_ownership)
+                                   & differs(dilution, increase * (1 - round_ownership), tolerance),
+                                   dilution, increase * (1 - round_ownership)))
+
+        # An Adjustment's Dilution (est) is divided by the dilution of the rounds before it, so without one it takes the
+        # value of every earlier investment to 0 (or leaves it as it is if missing). What it is divided into isn't kept
+        # once recalculated, so only that it is there can be checked
+        found.append(violations_of("Adjustment needs its own Dilution (est)", "Dilution (est)",
+                                   named & is_adjustment & later_round & (np.isnan(dilution) | (dilution == 0.0)), dilution, np.nan))
+
+    violations = pd.concat(found, ignore_index=True).sort_values("Row", kind="stable", ignore_index=True)
+    rows = violations["Row"].to_numpy()
+    violations.insert(0, "Name", df["Name"].to_numpy()[rows])
+    violations.insert(1, "Round #", df["Round #"].to_numpy()[rows])
+    violations["Difference"] = violations["Value"] - violations["Expected"]
+    violations["Tolerance"] = tolerance
+    return violations[VIOLATION_COLUMNS]
@@ -0,0 +1,67 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from calculations import write_rows
+from loading import round_csv_paths
+from store import key_hashes
+
+# Taking in the changes to a Round.csv export that is rewritten upstream while it's loaded: the files are polled by size
+# and modification time, which needs nothing but the file system, and only the rounds that were inserted, changed or
+# deleted since the file was loaded are applied to the round table, keyed on (Name, Round #).
+
+
+def source_stats(sources):
+    """Returns the path, size and modification time of each file of sources (a path, a folder or a list of paths), to
+    compare with a later call. Files that can't be read are left out, so they count as changed when they come back."""
+    paths = round_csv_paths(sources) if isinstance(sources, (str, os.PathLike)) else list(sources)
+    stats = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        stats.append((os.path.abspath(path), stat.st_size, stat.st_mtime_ns))
+    return stats
+
+
+def keyed_positions(df):
+    """Returns the positions of the rows of df that have a Name and Round #, with the hash of their key (see
+    store.key_hashes)."""
+    rounds = pd.to_numeric(df["Round #"], errors="coerce")
+    positions = np.flatnonzero((df["Name"].notna() & rounds.notna()).to_numpy())
+    keys = key_hashes(df["Name"].to_numpy()[positions], rounds.to_numpy()[positions].astype(int))
+    return positions, keys
+
+
+def apply_round_changes(df, changed, removed):
+    """Applies the rounds inserted or changed in a source file (changed) and the (Name, Round #) keys deleted from it
+    (removed), as found by store.changed_rounds against the rounds it was loaded with, to df, the round table loaded
+    from it with any edits since. A changed round replaces the row of df with its key where that is, a new round goes
+    after the last row of its company, or at the end. Returns the new table and the Names of the companies whose rows
+    changed."""
+    changed = changed.reindex(columns=df.columns)
+    names = list(pd.unique(pd.concat([changed["Name"].astype(object), pd.Series([name for name, _ in removed], dtype=object)])))
+    positions, keys = keyed_positions(df)
+    changed_keys = key_hashes(changed["Name"].to_numpy(), changed["Round #"].astype(float).astype(int).to_numpy())
+    # Of rounds listed twice the last one is the stored one (see store.keyed)
+    position_of = pd.Series(positions, index=keys)
+    position_of = position_of[~position_of.index.duplicated(keep="last")]
+    replaced_at = position_of.reindex(changed_keys).to_numpy()
+
+    if not removed and not np.isnan(replaced_at).any():
+        # Only rounds changed in place, copy just the columns that changed
+        merged = write_rows(df, replaced_at.astype(int), changed.reset_index(drop=True))
+        if merged is not None:
+            return merged, names
+
+    removed_keys = key_hashes([name for name, _ in removed], [int(number) for _, number in removed])
+    dropped = np.zeros(len(df), dtype=bool)
+    dropped[positions] = pd.Series(keys).isin(np.concatenate([changed_keys, removed_keys])).to_numpy()
+    # New rounds go after the last row of their company, or at the end
+    last_row = pd.Series(np.arange(len(df)), index=df["Name"].astype(object).to_numpy()).groupby(level=0).max()
+    after = last_row.reindex(changed["Name"].astype(object).to_numpy()).fillna(len(df)).to_numpy() + 0.5
+    order = np.concatenate([np.flatnonzero(~dropped), np.where(np.isnan(replaced_at), after, replaced_at)])
+    merged = pd.concat([df[~dropped], changed], ignore_index=True)
+    return merged.iloc[np.argsort(order, kind="stable")].reset_index(drop=True), names